@@ -0,0 +1,73 @@
+# backend/ads_service.py
+import logging
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+
+from backend.models import db, User, AdView
+from backend.config import Config
+from backend.housekeeping import PeriodicTask
+from backend.ads_config import ADS_CONFIG, get_ad_by_id
+
+logger = logging.getLogger(__name__)
+
+class AdRewardError(Exception):
+    """Récompense refusée (pub inconnue, déjà vue, limite du jour)"""
+
+class AdsService:
+    @staticmethod
+    def claim_reward(user_id, ad_id):
+        """Enregistre le visionnage et crédite la récompense.
+
+        La ligne utilisateur est verrouillée pendant la transaction, ce qui
+        rend la limite quotidienne et l'incrément de max_api_keys atomiques
+        entre workers ; la contrainte unique couvre la limite par pub.
+        Retourne le nouveau max_api_keys.
+        """
+        try:
+            ad_id = int(ad_id)
+        except (TypeError, ValueError):
+            raise AdRewardError("ID invalide")
+        
+        ad = get_ad_by_id(ad_id)
+        if not ad or not ad.get('active', True):
+            raise AdRewardError("Publicite introuvable")
+        
+        AdsService.maybe_purge()
+        today = date.today()
+        
+        user = User.query.filter_by(id=user_id).with_for_update().populate_existing().one()
+        
+        if AdView.query.filter_by(user_id=user_id, ad_id=ad_id, day=today).first():
+            db.session.rollback()
+            raise AdRewardError("Deja vu aujourd'hui")
+        
+        if AdView.query.filter_by(user_id=user_id, day=today).count() >= ADS_CONFIG['max_ads_per_day']:
+            db.session.rollback()
+            raise AdRewardError(ADS_CONFIG['messages']['daily_limit'])
+        
+        try:
+            db.session.add(AdView(user_id=user_id, ad_id=ad_id, day=today))
+            user.max_api_keys = (user.max_api_keys or 5) + ad.get('reward', ADS_CONFIG['default_reward'])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise AdRewardError("Deja vu aujourd'hui")
+        
+        return user.max_api_keys
+
+    @staticmethod
+    def maybe_purge():
+        """Purge au plus une fois par AD_VIEWS_PURGE_INTERVAL secondes et par worker"""
+        return _purge_task.maybe_run()
+
+    @staticmethod
+    def purge_old_days():
+        """Supprime les jours passés au-delà de AD_VIEWS_RETENTION_DAYS"""
+        cutoff = date.today() - timedelta(days=Config.AD_VIEWS_RETENTION_DAYS)
+        deleted = AdView.query.filter(AdView.day < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            logger.info("%s visionnages de pubs purgés", deleted)
+        return deleted
+
+_purge_task = PeriodicTask('ad_views', 'AD_VIEWS_PURGE_INTERVAL', AdsService.purge_old_days)
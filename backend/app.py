@@ -1,23 +1,41 @@
 #!/usr/bin/env python
 import sys
 import os
+import atexit
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, stream_with_context, g
 from flask_login import LoginManager, login_required, current_user, login_user
 import logging
 
-from backend.models import db, User, APIUsage, APIKey
+from backend.models import db, APIUsage
 from backend.auth import auth_bp, email_service
 from backend.chat_service import ChatService
 from backend.keys_service import KeysService
+from backend.otp_service import OTPService
+from backend.ads_service import AdsService, AdRewardError
+from backend.usage_service import UsageService
+from backend.quota_service import QuotaService, QuotaExceeded
+from backend.chat_jobs import ChatJobService, JobQueueFull, InvalidCallbackUrl, validate_callback_url
+from backend.ws_chat import init_ws_chat
+from backend.logging_config import setup_logging
+from backend.housekeeping import init_housekeeping
+from backend.db_routing import init_db_routing, read_replica, mark_primary_reads
+from backend.dashboard_service import DashboardService
+from backend.cancellation import ABORTED, CancelToken, disconnect_watcher
+from backend.fair_scheduler import QUEUE_FULL, QUEUE_TIMEOUT, chat_scheduler
+from backend.idempotency_service import IdempotencyService, IdempotencyError
+from backend.memory_profiler import init_memory_profiler, memory_profiler, sqlalchemy_identity_maps, require_debug_token
 from backend.google_service import init_google, get_google_client, google_client
 from backend.config import Config
 from backend.ads_config import get_active_ads
+from backend.user_cache import user_cache
+from backend.http_cache import payload_cache
+from backend.assets import init_assets
 
 # Configuration logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Initialisation des services
@@ -46,7 +64,9 @@ logger.info("=" * 50)
 logger.info("DÉMARRAGE DE L'APPLICATION")
 logger.info("=" * 50)
 
+init_db_routing(app)
 db.init_app(app)
+init_housekeeping(app)
 logger.info("✅ Base de données initialisée")
 
 email_service.init_app(app)
@@ -54,7 +74,7 @@ logger.info("✅ Service email initialisé")
 
 logger.info("Initialisation de Google OAuth...")
 init_google(app)
-logger.info(f"google_client global après init: {google_client}")
+logger.info("google_client global après init: %s", google_client)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -65,9 +85,25 @@ logger.info("✅ Login manager initialisé")
 
 app.register_blueprint(auth_bp, url_prefix='/auth')
 
+chat_jobs = ChatJobService(app, chat_service)
+
+init_ws_chat(app, chat_service)
+logger.info("✅ WebSocket chat initialisé")
+
+init_assets(app)
+logger.info("✅ Fichiers statiques versionnés")
+
+init_memory_profiler(app)
+memory_profiler.track('user_cache', lambda: len(user_cache._entries))
+memory_profiler.track('payload_cache', lambda: len(payload_cache._payloads))
+memory_profiler.track('dashboard_cache', lambda: len(DashboardService._cache))
+memory_profiler.track('quota_counters', lambda: len(QuotaService._counters))
+memory_profiler.track('scheduler_users', lambda: len(chat_scheduler.users))
+memory_profiler.track('sqlalchemy_identity_maps', sqlalchemy_identity_maps)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 # ============================================
 # ROUTES PRINCIPALES
@@ -76,6 +112,10 @@ def load_user(user_id):
 @app.route('/')
 def index():
     """Page d'accueil"""
+    return payload_cache.respond('page:index', render_index_page,
+                                 mimetype='text/html', max_age=Config.PAGE_CACHE_MAX_AGE)
+
+def render_index_page():
     return render_template('index.html', models=chat_service.get_models())
 
 @app.route('/faq')
@@ -86,6 +126,10 @@ def faq():
 @app.route('/docs')
 def documentation():
     """Page documentation"""
+    return payload_cache.respond('page:docs', render_docs_page,
+                                 mimetype='text/html', max_age=Config.PAGE_CACHE_MAX_AGE)
+
+def render_docs_page():
     return render_template('docs.html')
 
 @app.route('/chat', methods=['GET'])
@@ -93,7 +137,7 @@ def chat_page():
     """Page de chat avec vérification session ET token"""
     
     if current_user and current_user.is_authenticated:
-        logger.info(f"Accès chat par session: {current_user.username}")
+        logger.info("Accès chat par session: %s", current_user.username)
         return render_template('chat.html')
     
     token = request.args.get('token')
@@ -101,7 +145,7 @@ def chat_page():
         user = KeysService.verify_key(f"Bearer {token}")
         if user:
             login_user(user, remember=True)
-            logger.info(f"Accès chat par token URL: {user.username}")
+            logger.info("Accès chat par token URL: %s", user.username)
             return render_template('chat.html')
     
     logger.warning("Accès chat non autorisé, redirection vers login")
@@ -121,7 +165,7 @@ def register_page():
 @login_required
 def dashboard():
     """Tableau de bord utilisateur"""
-    logger.info(f"Accès dashboard: {current_user.username}")
+    logger.info("Accès dashboard: %s", current_user.username)
     return render_template('dashboard.html', user=current_user)
 
 # ============================================
@@ -130,7 +174,7 @@ def dashboard():
 
 @app.route('/api/models', methods=['GET'])
 def get_models():
-    return jsonify(chat_service.get_models())
+    return payload_cache.respond('models', chat_service.get_models)
 
 # ============================================
 # API CHAT
@@ -156,35 +200,142 @@ def chat():
     if not data or not data.get('message'):
         return jsonify({'error': 'Message requis'}), 400
     
-    response, error = chat_service.process_message(
-        data.get('model', 'okitakoy'), 
-        data.get('message')
-    )
+    key_id = g.get('api_key_id')
+    user_id, weight = user.id, chat_scheduler.weight_for(user)
+    model = data.get('model', 'okitakoy')
     
-    if error:
-        return jsonify({'error': error}), 400 if error == "Modele non supporte" else 500
+    # Une répétition avec la même Idempotency-Key rejoue la réponse enregistrée
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None:
+        if not idempotency_key.strip() or len(idempotency_key) > 255:
+            return jsonify({'error': 'Idempotency-Key invalide'}), 400
+        try:
+            stored = IdempotencyService.begin(
+                user_id, idempotency_key,
+                IdempotencyService.fingerprint(model, data.get('message'))
+            )
+        except IdempotencyError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        if stored:
+            body, status = stored
+            replay = jsonify(body)
+            replay.status_code = status
+            replay.headers['Idempotent-Replayed'] = 'true'
+            return replay
     
     try:
-        usage = APIUsage(
-            user_id=user.id,
-            model=data.get('model', 'okitakoy'),
-            prompt=data.get('message'),
-            response=response['response'],
-            tokens_used=response['tokens_used']
+        QuotaService.check(user_id, key_id)
+    except QuotaExceeded as e:
+        if idempotency_key is not None:
+            IdempotencyService.release(user_id, idempotency_key)
+        return jsonify({'error': str(e)}), 429
+    
+    # L'attente et l'appel upstream sont longs : on rend la connexion SQL au pool
+    db.session.remove()
+    
+    # Si le client ferme la connexion, l'appel upstream est interrompu
+    with disconnect_watcher.watch(request.environ, CancelToken()) as cancel:
+        response, error = chat_service.process_message(
+            model, 
+            data.get('message'),
+            cancel,
+            user_id,
+            weight
         )
-        db.session.add(usage)
-        db.session.commit()
-    except Exception as e:
-        logger.error(f"Erreur sauvegarde usage: {e}")
-        db.session.rollback()
+    
+    UsageService.log_chat(user_id, key_id, model, data.get('message'), response, error)
+    
+    if idempotency_key is not None:
+        if error:
+            IdempotencyService.release(user_id, idempotency_key)
+        else:
+            IdempotencyService.complete(user_id, idempotency_key, response)
+    
+    if error == ABORTED:
+        # Personne ne lira la réponse ; code nginx « client closed request »
+        return jsonify({'error': error}), 499
+    if error == QUEUE_FULL:
+        return jsonify({'error': error}), 429
+    if error == QUEUE_TIMEOUT:
+        return jsonify({'error': error}), 503
+    if error:
+        return jsonify({'error': error}), 400 if error == "Modele non supporte" else 500
     
     return jsonify(response)
 
+@app.route('/api/chat/jobs', methods=['POST'])
+def create_chat_job():
+    """Crée un job chat et retourne son id immédiatement (202)"""
+    user = None
+    
+    if current_user and current_user.is_authenticated:
+        user = current_user
+    else:
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            user = KeysService.verify_key(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Authentification requise'}), 401
+    
+    data = request.json
+    if not data or not data.get('message'):
+        return jsonify({'error': 'Message requis'}), 400
+    
+    model = data.get('model', 'okitakoy')
+    if model not in chat_service.models:
+        return jsonify({'error': 'Modele non supporte'}), 400
+    
+    callback_url = data.get('callback_url')
+    if callback_url:
+        try:
+            validate_callback_url(callback_url)
+        except InvalidCallbackUrl as e:
+            return jsonify({'error': str(e)}), 400
+    
+    key_id = g.get('api_key_id')
+    try:
+        QuotaService.check(user.id, key_id)
+    except QuotaExceeded as e:
+        return jsonify({'error': str(e)}), 429
+    
+    try:
+        job = chat_jobs.submit(user.id, key_id, model, data.get('message'), callback_url)
+    except JobQueueFull:
+        return jsonify({'error': 'Trop de jobs en attente, reessayez'}), 503
+    
+    response = jsonify(ChatJobService.to_dict(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_chat_job', job_id=job.id)
+    return response
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Statut et résultat d'un job chat"""
+    user = None
+    
+    if current_user and current_user.is_authenticated:
+        user = current_user
+    else:
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            user = KeysService.verify_key(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Authentification requise'}), 401
+    
+    job = chat_jobs.get(job_id, user.id)
+    if not job:
+        return jsonify({'error': 'Job introuvable'}), 404
+    
+    return jsonify(ChatJobService.to_dict(job))
+
 # ============================================
 # API CHECK AUTH (for frontend)
 # ============================================
 
 @app.route('/api/me', methods=['GET'])
+@read_replica
 def check_auth():
     """Vérifie l'authentification de l'utilisateur"""
     if current_user and current_user.is_authenticated:
@@ -213,6 +364,7 @@ def check_auth():
 # ============================================
 
 @app.route('/api/keys', methods=['GET'])
+@read_replica
 def get_api_keys():
     """Retourne la clé API active et les stats"""
     user = None
@@ -237,6 +389,7 @@ def get_api_keys():
     })
 
 @app.route('/api/keys/list', methods=['GET'])
+@read_replica
 @login_required
 def list_api_keys():
     """Liste toutes les clés API de l'utilisateur"""
@@ -251,30 +404,20 @@ def list_api_keys():
 @login_required
 def regenerate_api_key():
     """Génère une nouvelle clé API (si dans la limite)"""
-    if not hasattr(current_user, 'api_keys_generated'):
-        current_user.api_keys_generated = 1
-    if not hasattr(current_user, 'max_api_keys'):
-        current_user.max_api_keys = 5
-    
-    if current_user.api_keys_generated >= current_user.max_api_keys:
+    user = KeysService.regenerate(current_user.id)
+    if user is None:
         return jsonify({'error': 'Limite atteinte'}), 403
     
-    old_key = APIKey.query.filter_by(key=current_user.api_key).first()
-    if old_key:
-        old_key.is_active = False
-    
-    new_key = KeysService.generate_key()
-    current_user.api_key = new_key
-    current_user.api_keys_generated += 1
-    
-    KeysService.create_key(current_user.id, new_key)
     db.session.commit()
+    user_cache.invalidate(user.id)
+    DashboardService.invalidate(user.id)
+    mark_primary_reads()
     
     return jsonify({
         'success': True,
-        'api_key': new_key,
-        'keys_generated': current_user.api_keys_generated,
-        'max_keys': current_user.max_api_keys
+        'api_key': user.api_key,
+        'keys_generated': user.api_keys_generated,
+        'max_keys': user.max_api_keys
     })
 
 # ============================================
@@ -282,6 +425,7 @@ def regenerate_api_key():
 # ============================================
 
 @app.route('/api/usage', methods=['GET'])
+@read_replica
 @login_required
 def get_usage():
     """Historique d'utilisation"""
@@ -297,49 +441,122 @@ def get_usage():
         'created_at': str(u.created_at)
     } for u in usage])
 
+@app.route('/api/usage/stats', methods=['GET'])
+@read_replica
+@login_required
+def get_usage_stats():
+    """Statistiques agrégées (requêtes, tokens, erreurs) sur une période"""
+    try:
+        start = UsageService.parse_day(request.args.get('from'))
+        end = UsageService.parse_day(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'Date invalide (AAAA-MM-JJ)'}), 400
+    
+    return jsonify(UsageService.stats(current_user.id, start, end, request.args.get('model')))
+
+@app.route('/api/usage/quota', methods=['GET'])
+@login_required
+def get_usage_quota():
+    """Consommation de tokens et quotas de la période en cours"""
+    return jsonify(QuotaService.usage(current_user.id))
+
+@app.route('/api/usage/export', methods=['GET'])
+@read_replica
+def export_usage():
+    """Export complet de l'historique en NDJSON ou CSV (streaming)"""
+    user = None
+    if current_user and current_user.is_authenticated:
+        user = current_user
+    else:
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            user = KeysService.verify_key(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Non autorise'}), 401
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Format non supporte (ndjson ou csv)'}), 400
+    
+    try:
+        start = UsageService.parse_day(request.args.get('from'))
+        end = UsageService.parse_day(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'Date invalide (AAAA-MM-JJ)'}), 400
+    
+    query = UsageService.export_query(user.id, start, end, request.args.get('model'))
+    
+    if export_format == 'csv':
+        body, mimetype = UsageService.export_csv(query), 'text/csv'
+    else:
+        body, mimetype = UsageService.export_ndjson(query), 'application/x-ndjson'
+    
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=usage.{export_format}'
+    return response
+
 # ============================================
-# API PUBLICITÉS
+# API TABLEAU DE BORD
 # ============================================
 
-user_ad_views = {}
+@app.route('/api/dashboard', methods=['GET'])
+@read_replica
+def get_dashboard():
+    """Clé, usage récent, totaux et publicités en une seule réponse"""
+    user = None
+    if current_user and current_user.is_authenticated:
+        user = current_user
+    else:
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            user = KeysService.verify_key(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Non autorise'}), 401
+    
+    response = jsonify(DashboardService.get(user, build_ads_payload()))
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# ============================================
+# API PUBLICITÉS
+# ============================================
 
 @app.route('/api/ads', methods=['GET'])
 def get_ads():
     """Retourne la liste des publicités disponibles"""
-    return jsonify({
+    return payload_cache.respond('ads', build_ads_payload)
+
+def build_ads_payload():
+    return {
         'ads': get_active_ads(),
         'config': {'watch_duration': 5, 'default_reward': 1}
-    })
+    }
 
 @app.route('/api/ads/reward', methods=['POST'])
 @login_required
 def claim_ad_reward():
     """Réclamer une récompense après avoir regardé une pub"""
-    from datetime import date
-    
     data = request.json
     ad_id = data.get('adId')
     
     if not ad_id:
         return jsonify({"error": "ID requis"}), 400
     
-    today = date.today().isoformat()
-    user_key = f"{current_user.id}_{ad_id}_{today}"
-    
-    if user_key in user_ad_views:
-        return jsonify({"error": "Deja vu aujourd'hui"}), 400
-    
     try:
-        if not hasattr(current_user, 'max_api_keys'):
-            current_user.max_api_keys = 5
-        current_user.max_api_keys += 1
-        db.session.commit()
-        user_ad_views[user_key] = True
-        logger.info(f"✅ +1 clé max pour {current_user.username}")
-        return jsonify({'success': True, 'new_max_keys': current_user.max_api_keys})
+        new_max_keys = AdsService.claim_reward(current_user.id, ad_id)
+        user_cache.invalidate(current_user.id)
+        DashboardService.invalidate(current_user.id)
+        mark_primary_reads()
+        logger.info("✅ +1 clé max pour %s", current_user.username)
+        return jsonify({'success': True, 'new_max_keys': new_max_keys})
+    except AdRewardError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Erreur pub: {e}")
+        logger.error("Erreur pub: %s", e)
         return jsonify({"error": str(e)}), 500
 
 # ============================================
@@ -348,20 +565,51 @@ def claim_ad_reward():
 
 @app.route('/api/docs')
 def api_docs():
-    return jsonify({
+    base_url = request.host_url.rstrip('/')
+    return payload_cache.respond(f'docs:{base_url}', lambda: build_docs_payload(base_url))
+
+def build_docs_payload(base_url):
+    return {
         'name': 'Open Always API',
         'version': '1.0',
-        'base_url': request.host_url.rstrip('/'),
+        'base_url': base_url,
         'authentication': {'type': 'Bearer Token', 'header': 'Authorization: Bearer YOUR_API_KEY'},
         'endpoints': {
-            'chat': {'method': 'POST', 'url': '/api/chat', 'description': 'Envoyer un message à l\'IA'},
+            'chat': {'method': 'POST', 'url': '/api/chat', 'description': 'Envoyer un message à l\'IA (en-tête Idempotency-Key optionnel pour les nouvelles tentatives)'},
+            'chat_jobs': {'method': 'POST', 'url': '/api/chat/jobs', 'description': 'Requête longue en arrière-plan (suivi via /api/chat/jobs/<id> ou callback_url)'},
             'models': {'method': 'GET', 'url': '/api/models', 'description': 'Liste des modèles disponibles'},
             'keys': {'method': 'GET', 'url': '/api/keys', 'description': 'Obtenir sa clé API'},
             'regenerate': {'method': 'POST', 'url': '/api/keys/regenerate', 'description': 'Générer une nouvelle clé'},
             'usage': {'method': 'GET', 'url': '/api/usage', 'description': 'Historique d\'utilisation'},
             'ads': {'method': 'GET', 'url': '/api/ads', 'description': 'Publicités disponibles'}
         }
-    })
+    }
+
+def warm_payload_cache():
+    """Sérialise les réponses statiques au démarrage du worker"""
+    with app.app_context():
+        payload_cache.get('models', chat_service.get_models)
+        payload_cache.get('ads', build_ads_payload)
+        payload_cache.get('page:index', render_index_page,
+                          mimetype='text/html', max_age=Config.PAGE_CACHE_MAX_AGE)
+        payload_cache.get('page:docs', render_docs_page,
+                          mimetype='text/html', max_age=Config.PAGE_CACHE_MAX_AGE)
+    logger.info("✅ Réponses statiques pré-calculées")
+
+warm_payload_cache()
+
+def flush_quotas():
+    """Sauvegarde les compteurs de tokens à l'arrêt du worker"""
+    with app.app_context():
+        QuotaService.flush()
+
+atexit.register(flush_quotas)
+
+def flush_mails():
+    """Laisse partir les emails encore en file à l'arrêt du worker"""
+    email_service.dispatcher.shutdown(Config.MAIL_FLUSH_TIMEOUT)
+
+atexit.register(flush_mails)
 
 # ============================================
 # ROUTES DE DEBUG
@@ -397,6 +645,18 @@ def debug_login_view():
     </html>
     """
 
+@app.route('/debug/upstreams')
+@require_debug_token
+def debug_upstreams():
+    """Requêtes en cours, latence et erreurs par upstream"""
+    return jsonify(chat_service.upstream_stats())
+
+@app.route('/debug/scheduler')
+@require_debug_token
+def debug_scheduler():
+    """Créneaux occupés, files par utilisateur et temps d'attente par poids"""
+    return jsonify(chat_scheduler.stats())
+
 def has_url_for(endpoint):
     """Vérifie si un endpoint existe"""
     try:
@@ -412,6 +672,7 @@ if __name__ == '__main__':
     with app.app_context():
         try:
             db.create_all()
+            OTPService.ensure_indexes()
             print("✅ Tables créées/vérifiées")
         except Exception as e:
             print(f"⚠️ Erreur: {e}")
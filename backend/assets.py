@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Pipeline des fichiers statiques : empreinte, pré-compression, manifeste.
+
+Usage : python -m backend.assets
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+import logging
+from flask import request, send_from_directory, abort
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+IMMUTABLE_MAX_AGE = 31536000
+
+_manifest = {}
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Copie chaque fichier sous un nom haché avec ses variantes .gz/.br"""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for filename in files:
+            source = os.path.join(root, filename)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            base, ext = os.path.splitext(logical)
+            hashed = f"{base}.{digest}{ext}"
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            
+            if not os.path.exists(target):
+                _write_atomic(target, data)
+                if ext in COMPRESSIBLE:
+                    _write_atomic(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli:
+                        _write_atomic(target + '.br', brotli.compress(data, quality=11))
+            manifest[logical] = hashed
+    
+    os.makedirs(dist_dir, exist_ok=True)
+    _write_atomic(os.path.join(dist_dir, 'manifest.json'),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    logger.info("%s fichiers statiques générés dans %s", len(manifest), dist_dir)
+    return manifest
+
+def load_manifest():
+    global _manifest
+    try:
+        with open(MANIFEST_PATH) as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+def asset_url(path):
+    """URL versionnée d'un fichier statique (repli sur /static si non généré)"""
+    hashed = _manifest.get(path)
+    if hashed:
+        return f"/assets/{hashed}"
+    return f"/static/{path}"
+
+def serve_asset(filename):
+    """Sert un fichier versionné, pré-compressé selon Accept-Encoding"""
+    if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+        abort(404)
+    
+    accepted = request.accept_encodings
+    encoding = None
+    served = filename
+    if brotli and accepted['br'] and os.path.exists(os.path.join(DIST_DIR, filename + '.br')):
+        encoding, served = 'br', filename + '.br'
+    elif accepted['gzip'] and os.path.exists(os.path.join(DIST_DIR, filename + '.gz')):
+        encoding, served = 'gzip', filename + '.gz'
+    
+    response = send_from_directory(DIST_DIR, served, max_age=IMMUTABLE_MAX_AGE, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def init_assets(app):
+    """Construit le manifeste si besoin et expose asset_url aux templates"""
+    if app.config.get('ASSETS_BUILD_ON_START') or not os.path.exists(MANIFEST_PATH):
+        try:
+            build_assets()
+        except OSError as e:
+            logger.error("Erreur génération des fichiers statiques: %s", e)
+    load_manifest()
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    manifest = build_assets()
+    for logical, hashed in sorted(manifest.items()):
+        print(f"{logical} -> {hashed}")
+    sys.exit(0)
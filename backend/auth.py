@@ -1,22 +1,26 @@
 from flask import Blueprint, request, jsonify, redirect, url_for
-from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-import secrets
+from flask_login import login_user, logout_user, login_required
 import requests
 import logging
 
-from backend.models import db, User, OTPCode, APIKey
+from backend.models import db, User
 from backend.config import Config
 from backend.email_service import EmailService
 from backend.keys_service import KeysService
+from backend.otp_service import OTPService
+from backend.password_service import PasswordService, PasswordPoolBusy
 from backend.google_service import get_google_client
+from backend.user_cache import user_cache
 
 logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 email_service = EmailService()
 
+@auth_bp.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    return jsonify({'error': 'Serveur occupe, reessayez dans un instant'}), 503
+
 def verify_turnstile(token):
     if not token:
         logger.warning("Turnstile token manquant")
@@ -38,13 +42,13 @@ def verify_turnstile(token):
         result = response.json()
         return result.get('success', False)
     except Exception as e:
-        logger.error(f"Erreur Turnstile: {e}")
+        logger.error("Erreur Turnstile: %s", e)
         return False
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
-    logger.info(f"Tentative inscription: {data.get('email')}")
+    logger.info("Tentative inscription: %s", data.get('email'))
     
     if not data.get('email') or not data.get('username') or not data.get('password'):
         return jsonify({'error': 'Tous les champs sont requis'}), 400
@@ -58,31 +62,26 @@ def register():
     if User.query.filter_by(username=data['username']).first():
         return jsonify({'error': "Nom d'utilisateur deja pris"}), 400
     
+    password_hash = PasswordService.hash_password(data['password'])
+    
     try:
         user = User(
             email=data['email'],
             username=data['username'],
-            password_hash=generate_password_hash(data['password'])
+            password_hash=password_hash
         )
         db.session.add(user)
         db.session.flush()
         
         KeysService.create_key(user.id, user.api_key)
         
-        otp = secrets.token_hex(3).upper()
-        otp_code = OTPCode(
-            user_id=user.id,
-            code=otp,
-            purpose='verification',
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
-        )
-        db.session.add(otp_code)
+        otp = OTPService.issue(user.id, 'verification')
         db.session.commit()
         
         email_sent = email_service.send_otp(user.email, otp, "verification")
         
         if not email_sent:
-            logger.warning(f"Email non envoye a {user.email} - verification manuelle requise")
+            logger.warning("Email non envoye a %s - verification manuelle requise", user.email)
         
         return jsonify({
             'success': True,
@@ -94,7 +93,7 @@ def register():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Erreur inscription: {e}")
+        logger.error("Erreur inscription: %s", e)
         return jsonify({'error': "Erreur lors de l'inscription"}), 500
 
 @auth_bp.route('/verify-email', methods=['POST'])
@@ -105,22 +104,14 @@ def verify_email():
     if not user:
         return jsonify({'error': 'Utilisateur non trouve'}), 404
     
-    otp = OTPCode.query.filter_by(
-        user_id=user.id,
-        code=data.get('code', '').upper().strip(),
-        purpose='verification',
-        used=False
-    ).first()
-    
-    if not otp:
-        return jsonify({'error': 'Code invalide'}), 400
-    
-    if otp.expires_at < datetime.utcnow():
-        return jsonify({'error': 'Code expire'}), 400
+    otp, error = OTPService.find(user.id, data.get('code', ''), 'verification')
+    if error:
+        return jsonify({'error': error}), 400
     
     user.is_verified = True
     otp.used = True
     db.session.commit()
+    user_cache.invalidate(user.id)
     
     login_user(user)
     
@@ -137,25 +128,18 @@ def login():
         return redirect(url_for('login_page'))
     
     data = request.json
-    logger.info(f"Tentative connexion: {data.get('email')}")
+    logger.info("Tentative connexion: %s", data.get('email'))
     
     if not data.get('email') or not data.get('password'):
         return jsonify({'error': 'Email et mot de passe requis'}), 400
     
     user = User.query.filter_by(email=data['email']).first()
     
-    if not user or not user.password_hash or not check_password_hash(user.password_hash, data['password']):
+    if not user or not user.password_hash or not PasswordService.check_password(user.password_hash, data['password']):
         return jsonify({'error': 'Email ou mot de passe incorrect'}), 401
     
     if not user.is_verified:
-        otp = secrets.token_hex(3).upper()
-        otp_code = OTPCode(
-            user_id=user.id,
-            code=otp,
-            purpose='verification',
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
-        )
-        db.session.add(otp_code)
+        otp = OTPService.issue(user.id, 'verification')
         db.session.commit()
         
         email_sent = email_service.send_otp(user.email, otp, "verification")
@@ -169,7 +153,7 @@ def login():
         }), 401
     
     login_user(user, remember=True)
-    logger.info(f"Connexion reussie: {user.email}")
+    logger.info("Connexion reussie: %s", user.email)
     
     return jsonify({
         'success': True,
@@ -188,7 +172,7 @@ def google_login():
         return jsonify({'error': 'Service Google temporairement indisponible'}), 503
     
     redirect_uri = url_for('auth.google_callback', _external=True)
-    logger.info(f"Redirect URI: {redirect_uri}")
+    logger.info("Redirect URI: %s", redirect_uri)
     return google.authorize_redirect(redirect_uri)
 
 @auth_bp.route('/google-callback')
@@ -202,7 +186,7 @@ def google_callback():
     try:
         token = google.authorize_access_token()
         userinfo = google.parse_id_token(token, nonce=None)
-        logger.info(f"Utilisateur Google: {userinfo.get('email')}")
+        logger.info("Utilisateur Google: %s", userinfo.get('email'))
         
         user = User.query.filter_by(google_id=userinfo['sub']).first()
         
@@ -214,6 +198,7 @@ def google_callback():
                     existing_user.is_verified = True
                 user = existing_user
                 db.session.commit()
+                user_cache.invalidate(user.id)
             else:
                 username_base = userinfo['email'].split('@')[0]
                 username = username_base
@@ -238,7 +223,7 @@ def google_callback():
         return redirect(f'/dashboard?api_key={user.api_key}&username={user.username}')
         
     except Exception as e:
-        logger.error(f"Erreur Google OAuth: {e}")
+        logger.error("Erreur Google OAuth: %s", e)
         return redirect('/auth/login?error=google_failed')
 
 @auth_bp.route('/forgot-password', methods=['POST'])
@@ -250,14 +235,7 @@ def forgot_password():
         return jsonify({'error': 'Email non trouve'}), 404
     
     try:
-        otp = secrets.token_hex(3).upper()
-        otp_code = OTPCode(
-            user_id=user.id,
-            code=otp,
-            purpose='reset',
-            expires_at=datetime.utcnow() + timedelta(minutes=10)
-        )
-        db.session.add(otp_code)
+        otp = OTPService.issue(user.id, 'reset')
         db.session.commit()
         
         email_sent = email_service.send_otp(user.email, otp, "reset")
@@ -270,7 +248,7 @@ def forgot_password():
         })
         
     except Exception as e:
-        logger.error(f"Erreur forgot password: {e}")
+        logger.error("Erreur forgot password: %s", e)
         return jsonify({'error': "Erreur lors de l'envoi"}), 500
 
 @auth_bp.route('/reset-password', methods=['POST'])
@@ -281,22 +259,14 @@ def reset_password():
     if not user:
         return jsonify({'error': 'Utilisateur non trouve'}), 404
     
-    otp = OTPCode.query.filter_by(
-        user_id=user.id,
-        code=data.get('code', '').upper().strip(),
-        purpose='reset',
-        used=False
-    ).first()
-    
-    if not otp:
-        return jsonify({'error': 'Code invalide'}), 400
-    
-    if otp.expires_at < datetime.utcnow():
-        return jsonify({'error': 'Code expire'}), 400
+    otp, error = OTPService.find(user.id, data.get('code', ''), 'reset')
+    if error:
+        return jsonify({'error': error}), 400
     
-    user.password_hash = generate_password_hash(data['new_password'])
+    user.password_hash = PasswordService.hash_password(data['new_password'])
     otp.used = True
     db.session.commit()
+    user_cache.invalidate(user.id)
     
     return jsonify({'success': True, 'message': 'Mot de passe reinitialise'})
 
@@ -321,14 +291,7 @@ def resend_otp():
     if not user:
         return jsonify({'error': 'Utilisateur non trouve'}), 404
     
-    otp = secrets.token_hex(3).upper()
-    otp_code = OTPCode(
-        user_id=user.id,
-        code=otp,
-        purpose=data.get('purpose', 'verification'),
-        expires_at=datetime.utcnow() + timedelta(minutes=10)
-    )
-    db.session.add(otp_code)
+    otp = OTPService.issue(user.id, data.get('purpose', 'verification'))
     db.session.commit()
     
     email_sent = email_service.send_otp(user.email, otp, data.get('purpose', 'verification'))
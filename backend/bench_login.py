@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Benchmark : débit des connexions sous charge de chat concurrente.
+
+Usage : python -m backend.bench_login [--logins 200] [--login-threads 8] [--chat-threads 8]
+
+Lance l'application sur une base SQLite temporaire, avec un faux service
+Okitakoy, et compare le hachage dans le thread de la requête (pool=0)
+au pool de processus.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def run(app, args, pool_workers):
+    from backend.config import Config
+    from backend.password_service import PasswordService
+    
+    Config.PASSWORD_POOL_WORKERS = pool_workers
+    PasswordService.shutdown()
+    
+    stop = threading.Event()
+    chat_latencies = []
+    login_latencies = []
+    login_errors = []
+    remaining = [args.logins]
+    lock = threading.Lock()
+    
+    def chat_loop():
+        client = app.test_client()
+        client.post('/auth/login', json={'email': 'bench@example.com', 'password': 'bench-password'})
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.post('/api/chat', json={'model': 'okitakoy', 'message': 'Bonjour'})
+            chat_latencies.append(time.perf_counter() - start)
+    
+    def login_loop():
+        client = app.test_client()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            res = client.post('/auth/login', json={'email': 'bench@example.com', 'password': 'bench-password'})
+            login_latencies.append(time.perf_counter() - start)
+            if res.status_code != 200:
+                login_errors.append(res.status_code)
+    
+    chat_threads = [threading.Thread(target=chat_loop) for _ in range(args.chat_threads)]
+    for t in chat_threads:
+        t.start()
+    
+    start = time.perf_counter()
+    login_threads = [threading.Thread(target=login_loop) for _ in range(args.login_threads)]
+    for t in login_threads:
+        t.start()
+    for t in login_threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    
+    stop.set()
+    for t in chat_threads:
+        t.join()
+    
+    label = f"pool={pool_workers}" if pool_workers else "inline"
+    print(f"{label:>8} | connexions/s {args.logins / elapsed:7.1f} "
+          f"| connexion p50 {percentile(login_latencies, 50) * 1000:6.1f}ms p95 {percentile(login_latencies, 95) * 1000:6.1f}ms "
+          f"| chat p50 {percentile(chat_latencies, 50) * 1000:6.1f}ms p95 {percentile(chat_latencies, 95) * 1000:6.1f}ms "
+          f"| erreurs {len(login_errors)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--chat-threads', type=int, default=8)
+    parser.add_argument('--pool-workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--upstream-delay', type=float, default=0.05, help="latence simulée du service IA (s)")
+    args = parser.parse_args()
+    
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    
+    import logging
+    logging.disable(logging.WARNING)
+    
+    from backend.app import app, chat_service
+    from backend.models import db, User, APIKey
+    from backend.password_service import PasswordService
+    
+    def fake_call_api(message, personality, pool=None, cancel=None):
+        time.sleep(args.upstream_delay)
+        return "Bonjour ! " * 20
+    chat_service.call_api = fake_call_api
+    
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        user = User(email='bench@example.com', username='bench', is_verified=True,
+                    password_hash=PasswordService.hash_password('bench-password'))
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(APIKey(user_id=user.id, key=user.api_key))
+        db.session.commit()
+    
+    print(f"{args.logins} connexions, {args.login_threads} threads connexion, {args.chat_threads} threads chat")
+    run(app, args, 0)
+    run(app, args, args.pool_workers)
+    PasswordService.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# backend/cancellation.py
+import select
+import socket
+import threading
+import logging
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+ABORTED = "Requete annulee"
+
+class CancelToken:
+    """Signal d'annulation partagé entre la route et l'appel upstream"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug("Callback d'annulation en erreur: %s", e)
+
+    def on_cancel(self, callback):
+        """Enregistre callback ; appelé tout de suite si déjà annulé"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+# ============================================
+# CÔTÉ UPSTREAM : couper la connexion en cours
+# ============================================
+
+_current = threading.local()
+
+@contextmanager
+def bind(token):
+    """Rend token visible des connexions HTTP ouvertes par ce thread"""
+    previous = getattr(_current, 'token', None)
+    _current.token = token
+    try:
+        yield token
+    finally:
+        _current.token = previous
+
+class _CancellableMixin:
+    def getresponse(self, *args, **kwargs):
+        token = getattr(_current, 'token', None)
+        sock = self.sock
+        if token is None or sock is None:
+            return super().getresponse(*args, **kwargs)
+        # shutdown débloque le recv en cours ; la connexion n'est pas réutilisée
+        remove = token.on_cancel(lambda: sock.shutdown(socket.SHUT_RDWR))
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            remove()
+
+class CancellableHTTPConnection(_CancellableMixin, HTTPConnection):
+    pass
+
+class CancellableHTTPSConnection(_CancellableMixin, HTTPSConnection):
+    pass
+
+class _CancellableHTTPPool(HTTPConnectionPool):
+    ConnectionCls = CancellableHTTPConnection
+
+class _CancellableHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = CancellableHTTPSConnection
+
+class CancellableAdapter(HTTPAdapter):
+    """Adaptateur requests dont l'attente de réponse s'interrompt sur annulation"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CancellableHTTPPool,
+            'https': _CancellableHTTPSPool
+        }
+
+# ============================================
+# CÔTÉ CLIENT : détecter la déconnexion
+# ============================================
+
+def client_socket(environ):
+    """Socket du client sous le serveur de dev ou gunicorn (sync/gthread)"""
+    return environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+
+def _is_closed(sock):
+    try:
+        # poll et non select : select refuse les descripteurs >= FD_SETSIZE (1024)
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        events = poller.poll(0)
+        if not events:
+            return False
+        if events[0][1] & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
+            return True
+        return sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
+
+class DisconnectWatcher:
+    """Un seul thread surveille les sockets des requêtes chat en cours.
+
+    Une fin de fichier lue sans consommer (MSG_PEEK) signifie que le client
+    a fermé la connexion : le jeton associé est annulé.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='disconnect-watcher', daemon=True)
+            self._thread.start()
+
+    @contextmanager
+    def watch(self, environ, token):
+        sock = client_socket(environ)
+        if sock is None:
+            yield token
+            return
+        key = id(token)
+        with self._lock:
+            self._watched[key] = (sock, token)
+            self._ensure_thread()
+        self._wakeup.set()
+        try:
+            yield token
+        finally:
+            with self._lock:
+                self._watched.pop(key, None)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                watched = list(self._watched.items())
+            if not watched:
+                self._wakeup.wait()
+                continue
+            for key, (sock, token) in watched:
+                if not token.cancelled and _is_closed(sock):
+                    logger.info("Client déconnecté, annulation de l'appel upstream")
+                    token.cancel()
+
+disconnect_watcher = DisconnectWatcher()
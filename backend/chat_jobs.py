@@ -0,0 +1,189 @@
+# backend/chat_jobs.py
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+import socket
+import ipaddress
+import requests
+from urllib.parse import urlparse
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.models import db, ChatJob
+from backend.config import Config
+from backend.housekeeping import PeriodicTask
+from backend.usage_service import UsageService
+from backend.user_cache import user_cache
+from backend.fair_scheduler import chat_scheduler
+
+logger = logging.getLogger(__name__)
+
+class InvalidCallbackUrl(Exception):
+    """callback_url refusée (schéma, hôte non autorisé ou adresse interne)"""
+
+def validate_callback_url(url):
+    """Contre le SSRF : https uniquement, hôte dans la liste autorisée si elle
+    est configurée, et toutes les adresses résolues doivent être publiques"""
+    parsed = urlparse(url or '')
+    if parsed.scheme != 'https' or not parsed.hostname:
+        raise InvalidCallbackUrl("callback_url doit etre une URL https")
+    
+    host = parsed.hostname.lower()
+    allowed = [h.strip().lower() for h in Config.CHAT_JOB_WEBHOOK_ALLOWED_HOSTS.split(',') if h.strip()]
+    if allowed and not any(host == h or host.endswith('.' + h) for h in allowed):
+        raise InvalidCallbackUrl("Hote de callback_url non autorise")
+    
+    try:
+        infos = socket.getaddrinfo(host, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise InvalidCallbackUrl("Hote de callback_url introuvable")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%', 1)[0])
+        if not address.is_global:
+            raise InvalidCallbackUrl("callback_url pointe vers une adresse interne")
+
+class JobQueueFull(Exception):
+    """Trop de jobs en attente sur ce worker"""
+
+class ChatJobService:
+    """Traitement asynchrone des requêtes chat longues.
+
+    Le job est enregistré dans chat_jobs (donc consultable depuis n'importe
+    quel worker), exécuté par un pool de threads du worker qui l'a reçu,
+    puis conservé CHAT_JOB_TTL secondes.
+    """
+
+    def __init__(self, app, chat_service):
+        self.app = app
+        self.chat_service = chat_service
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._purge_task = PeriodicTask('chat_jobs', 'CHAT_JOB_PURGE_INTERVAL', self.purge_expired)
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=Config.CHAT_JOB_WORKERS,
+                                                        thread_name_prefix='chat-job')
+                    self._pid = os.getpid()
+                    self._pending = 0
+        return self._executor
+
+    def submit(self, user_id, key_id, model, message, callback_url=None):
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= Config.CHAT_JOB_MAX_PENDING:
+                raise JobQueueFull()
+            self._pending += 1
+        
+        try:
+            self.maybe_purge()
+            job = ChatJob(
+                id=uuid.uuid4().hex,
+                user_id=user_id,
+                api_key_id=key_id,
+                model=model,
+                prompt=message,
+                callback_url=callback_url,
+                status='pending',
+                expires_at=datetime.utcnow() + timedelta(seconds=Config.CHAT_JOB_TTL)
+            )
+            db.session.add(job)
+            db.session.commit()
+            executor.submit(self._run, job.id)
+            return job
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def get(self, job_id, user_id):
+        job = db.session.get(ChatJob, job_id)
+        if not job or job.user_id != user_id or job.expires_at < datetime.utcnow():
+            return None
+        return job
+
+    @staticmethod
+    def to_dict(job):
+        data = {
+            'id': job.id,
+            'status': job.status,
+            'model': job.model,
+            'created_at': str(job.created_at),
+            'finished_at': str(job.finished_at) if job.finished_at else None,
+            'expires_at': str(job.expires_at)
+        }
+        if job.status == 'done':
+            data['result'] = json.loads(job.result)
+        elif job.status == 'error':
+            data['error'] = job.error
+        return data
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                job = db.session.get(ChatJob, job_id)
+                if not job:
+                    return
+                job.status = 'running'
+                db.session.commit()
+                
+                weight = chat_scheduler.weight_for(user_cache.get(job.user_id))
+                response, error = self.chat_service.process_message(
+                    job.model, job.prompt, user_id=job.user_id, weight=weight
+                )
+                UsageService.log_chat(job.user_id, job.api_key_id, job.model, job.prompt, response, error)
+                
+                job.status = 'error' if error else 'done'
+                job.error = error
+                job.result = json.dumps(response) if response else None
+                job.finished_at = datetime.utcnow()
+                job.expires_at = job.finished_at + timedelta(seconds=Config.CHAT_JOB_TTL)
+                db.session.commit()
+                
+                if job.callback_url:
+                    self._notify(job)
+        except Exception as e:
+            logger.error("Erreur job chat %s: %s", job_id, e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _notify(self, job):
+        """Webhook : POST du job terminé vers callback_url"""
+        payload = self.to_dict(job)
+        for attempt in range(Config.CHAT_JOB_WEBHOOK_RETRIES + 1):
+            try:
+                # Revalidé à chaque envoi : le DNS a pu changer depuis la création
+                validate_callback_url(job.callback_url)
+                res = requests.post(job.callback_url, json=payload, timeout=10, allow_redirects=False)
+                if res.status_code < 500:
+                    return True
+            except InvalidCallbackUrl as e:
+                logger.warning("Webhook job %s refusé: %s", job.id, e)
+                return False
+            except Exception as e:
+                logger.warning("Webhook job %s en échec: %s", job.id, e)
+            if attempt < Config.CHAT_JOB_WEBHOOK_RETRIES:
+                time.sleep(2 ** attempt)
+        logger.error("Webhook job %s abandonné: %s", job.id, job.callback_url)
+        return False
+
+    def maybe_purge(self):
+        """Purge au plus une fois par CHAT_JOB_PURGE_INTERVAL secondes et par worker"""
+        return self._purge_task.maybe_run()
+
+    @staticmethod
+    def purge_expired():
+        deleted = ChatJob.query.filter(ChatJob.expires_at < datetime.utcnow())\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            logger.info("%s jobs chat expirés purgés", deleted)
+        return deleted
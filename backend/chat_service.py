@@ -1,13 +1,21 @@
+import time
 import requests
 import logging
 from backend.config import Config
+from backend.upstream_pool import UpstreamPool
+from backend.cancellation import ABORTED, CancellableAdapter, bind
+from backend.fair_scheduler import SchedulerRejected, chat_scheduler
 
 logger = logging.getLogger(__name__)
 
 class ChatService:
     def __init__(self):
-        self.api_url = Config.OKITAKOY_API_URL + "/ask"
+        self.pool = UpstreamPool(Config.OKITAKOY_API_URLS or [Config.OKITAKOY_API_URL])
+        self.http = requests.Session()
+        self.http.mount('http://', CancellableAdapter())
+        self.http.mount('https://', CancellableAdapter())
         self.models = self._init_models()
+        self._init_model_pools()
     
     def _init_models(self):
         return {
@@ -25,29 +33,60 @@ class ChatService:
             'okitakoy': {'name': 'Okitakoy AI', 'provider': 'Okitakoy Inc.', 'system_prompt': "You are Okitakoy AI, created by Precieux Okitakoy from Okitakoy Inc. You're friendly and enthusiastic. Always respond in the same language as the user's message."}
         }
     
+    def _init_model_pools(self):
+        """Pools dédiés déclarés dans OKITAKOY_MODEL_UPSTREAMS"""
+        for entry in Config.OKITAKOY_MODEL_UPSTREAMS.split(';'):
+            if '=' not in entry:
+                continue
+            model_id, urls = entry.split('=', 1)
+            urls = [u.strip() for u in urls.split(',') if u.strip()]
+            if model_id.strip() in self.models and urls:
+                self.models[model_id.strip()]['upstreams'] = UpstreamPool(urls)
+    
+    def upstream_stats(self):
+        stats = {'default': self.pool.stats()}
+        for model_id, model in self.models.items():
+            if 'upstreams' in model:
+                stats[model_id] = model['upstreams'].stats()
+        return stats
+    
     def get_models(self):
         return {k: {'name': v['name'], 'provider': v['provider']} for k, v in self.models.items()}
     
-    def call_api(self, message, personality):
+    def call_api(self, message, personality, pool=None, cancel=None):
         full_prompt = f"[SYSTEM]\n{personality}\n\n[USER]\n{message}\n\n[ASSISTANT]"
+        pool = pool or self.pool
+        if cancel is not None and cancel.cancelled:
+            return None
+        upstream = pool.acquire()
+        start = time.monotonic()
+        ok = False
         
         try:
-            response = requests.get(
-                self.api_url,
-                params={'text': full_prompt},
-                timeout=30
-            )
+            with bind(cancel):
+                response = self.http.get(
+                    upstream.url + "/ask",
+                    params={'text': full_prompt},
+                    timeout=30
+                )
             
+            # Un 4xx vient de la requête, pas de la santé de l'upstream
+            ok = response.status_code < 500
             if response.status_code == 200:
                 data = response.json()
                 return data.get('response', data.get('text', ''))
-            logger.error(f"API returned status {response.status_code}")
+            logger.error("API returned status %s (%s)", response.status_code, upstream.url)
             return None
         except Exception as e:
-            logger.error(f"Erreur API Okitakoy: {e}")
+            if cancel is not None and cancel.cancelled:
+                return None
+            logger.error("Erreur API Okitakoy (%s): %s", upstream.url, e)
             return None
+        finally:
+            aborted = cancel is not None and cancel.cancelled
+            pool.release(upstream, time.monotonic() - start, ok or aborted, aborted)
     
-    def process_message(self, model_id, message):
+    def process_message(self, model_id, message, cancel=None, user_id=None, weight=1):
         if model_id not in self.models:
             return None, "Modele non supporte"
         
@@ -55,7 +94,14 @@ class ChatService:
             return None, "Message vide"
         
         model = self.models[model_id]
-        response = self.call_api(message, model['system_prompt'])
+        try:
+            with chat_scheduler.slot(user_id, weight, cancel):
+                response = self.call_api(message, model['system_prompt'], model.get('upstreams'), cancel)
+        except SchedulerRejected as e:
+            return None, str(e)
+        
+        if cancel is not None and cancel.cancelled:
+            return None, ABORTED
         
         if not response:
             return None, "Erreur API - reessayez"
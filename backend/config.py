@@ -18,10 +18,16 @@ class Config:
         'pool_timeout': 10,
     }
     
+    # Réplicas en lecture (séparés par des virgules)
+    DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_LAG_CHECK_INTERVAL = 10
+    REPLICA_READ_YOUR_WRITES_SECONDS = 10
+    
     # ===== EMAIL - Configuration SMTP Gmail =====
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USE_SSL = False
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
@@ -29,6 +35,38 @@ class Config:
     MAIL_TIMEOUT = 30
     MAIL_DEBUG = False
     
+    # File d'envoi en arrière-plan
+    MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE', 500))
+    MAIL_BATCH_SIZE = 20
+    MAIL_MAX_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 1.0
+    MAIL_IDLE_TIMEOUT = 60
+    MAIL_FLUSH_TIMEOUT = float(os.environ.get('MAIL_FLUSH_TIMEOUT', 10))
+    
+    # Codes OTP
+    OTP_TTL_MINUTES = 10
+    OTP_PURGE_INTERVAL = int(os.environ.get('OTP_PURGE_INTERVAL', 300))
+    OTP_PURGE_BATCH_SIZE = 500
+    
+    # Hachage des mots de passe (0 = dans le thread de la requête)
+    PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', 2))
+    PASSWORD_MAX_PENDING = int(os.environ.get('PASSWORD_MAX_PENDING', 8))
+    PASSWORD_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', 5))
+    
+    # Journal des publicités vues
+    AD_VIEWS_RETENTION_DAYS = 2
+    AD_VIEWS_PURGE_INTERVAL = int(os.environ.get('AD_VIEWS_PURGE_INTERVAL', 3600))
+    
+    # Export de l'historique d'utilisation
+    USAGE_EXPORT_CHUNK_SIZE = 1000
+    
+    # Partitions mensuelles de api_usage (python -m backend.partitions maintain)
+    USAGE_PARTITION_MONTHS_AHEAD = 3
+    USAGE_PARTITION_CHECK_INTERVAL = 86400
+    USAGE_RETENTION_MONTHS = int(os.environ.get('USAGE_RETENTION_MONTHS', 0))   # 0 = tout garder
+    USAGE_ARCHIVE_ENABLED = os.environ.get('USAGE_ARCHIVE_ENABLED', 'true').lower() == 'true'
+    USAGE_ARCHIVE_DIR = os.environ.get('USAGE_ARCHIVE_DIR', 'archives')
+    
     # Google OAuth
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
@@ -39,3 +77,79 @@ class Config:
     
     # API Okitakoy
     OKITAKOY_API_URL = os.environ.get('OKITAKOY_API_URL', 'https://llm-chat-app-template.deltaprecieux851.workers.dev')
+    # Plusieurs workers séparés par des virgules ; par modèle : "gpt4=https://a,https://b;claude=https://c"
+    OKITAKOY_API_URLS = [u.strip() for u in os.environ.get('OKITAKOY_API_URLS', '').split(',') if u.strip()]
+    OKITAKOY_MODEL_UPSTREAMS = os.environ.get('OKITAKOY_MODEL_UPSTREAMS', '')
+    UPSTREAM_MAX_FAILURES = 3
+    UPSTREAM_EJECT_SECONDS = 30
+    UPSTREAM_EWMA_ALPHA = 0.3
+    
+    # Cache des utilisateurs connectés (secondes, par worker)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 5000))
+    
+    # Cache HTTP des réponses statiques (/api/models, /api/ads, /api/docs, pages)
+    PAYLOAD_CACHE_MAX_AGE = int(os.environ.get('PAYLOAD_CACHE_MAX_AGE', 300))
+    PAGE_CACHE_MAX_AGE = int(os.environ.get('PAGE_CACHE_MAX_AGE', 60))
+    
+    # Fichiers statiques versionnés (python -m backend.assets)
+    ASSETS_BUILD_ON_START = os.environ.get('ASSETS_BUILD_ON_START', 'true').lower() == 'true'
+    
+    # Quotas de tokens (0 = illimité)
+    QUOTA_USER_DAILY_TOKENS = int(os.environ.get('QUOTA_USER_DAILY_TOKENS', 0))
+    QUOTA_USER_MONTHLY_TOKENS = int(os.environ.get('QUOTA_USER_MONTHLY_TOKENS', 0))
+    QUOTA_KEY_DAILY_TOKENS = int(os.environ.get('QUOTA_KEY_DAILY_TOKENS', 0))
+    QUOTA_KEY_MONTHLY_TOKENS = int(os.environ.get('QUOTA_KEY_MONTHLY_TOKENS', 0))
+    QUOTA_FLUSH_INTERVAL = int(os.environ.get('QUOTA_FLUSH_INTERVAL', 10))
+    
+    # Jobs chat asynchrones (/api/chat/jobs)
+    CHAT_JOB_WORKERS = int(os.environ.get('CHAT_JOB_WORKERS', 4))
+    CHAT_JOB_MAX_PENDING = int(os.environ.get('CHAT_JOB_MAX_PENDING', 100))
+    CHAT_JOB_TTL = int(os.environ.get('CHAT_JOB_TTL', 3600))
+    CHAT_JOB_PURGE_INTERVAL = 300
+    CHAT_JOB_WEBHOOK_RETRIES = 2
+    CHAT_JOB_WEBHOOK_ALLOWED_HOSTS = os.environ.get('CHAT_JOB_WEBHOOK_ALLOWED_HOSTS', '')   # vide = tout hôte public
+    
+    # Ordonnancement équitable des appels upstream (par worker)
+    CHAT_SCHEDULER_SLOTS = int(os.environ.get('CHAT_SCHEDULER_SLOTS', 8))
+    CHAT_USER_QUEUE_SIZE = int(os.environ.get('CHAT_USER_QUEUE_SIZE', 20))
+    CHAT_QUEUE_TIMEOUT = int(os.environ.get('CHAT_QUEUE_TIMEOUT', 30))
+    CHAT_WEIGHT_UNVERIFIED = 1
+    CHAT_WEIGHT_VERIFIED = 2
+    CHAT_WEIGHT_KEYS_STEP = 5
+    
+    # Chat WebSocket (/ws/chat)
+    WS_WORKERS = int(os.environ.get('WS_WORKERS', 8))
+    WS_MAX_INFLIGHT = int(os.environ.get('WS_MAX_INFLIGHT', 4))
+    WS_IDLE_TIMEOUT = int(os.environ.get('WS_IDLE_TIMEOUT', 300))
+    WS_STREAM_CHUNK_WORDS = 8
+    WS_ALLOWED_ORIGINS = os.environ.get('WS_ALLOWED_ORIGINS', '')   # en plus de l'hôte courant
+    
+    # Logs : file + thread d'écriture, JSON, échantillonnage par route
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_QUEUE_SIZE = 10000
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', 'chat_page=0.1,dashboard=0.1')
+    
+    # Tableau de bord (/api/dashboard)
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 15))
+    DASHBOARD_CACHE_MAX_SIZE = 5000
+    DASHBOARD_RECENT_USAGE = 10
+    
+    # Profilage mémoire par worker (/debug/memory)
+    MEMORY_PROFILING = os.environ.get('MEMORY_PROFILING', 'false').lower() == 'true'
+    # Jeton Bearer exigé par /debug/memory, /debug/upstreams et /debug/scheduler
+    MEMORY_DEBUG_TOKEN = os.environ.get('MEMORY_DEBUG_TOKEN')
+    MEMORY_SAMPLE_INTERVAL = int(os.environ.get('MEMORY_SAMPLE_INTERVAL', 60))
+    MEMORY_RECYCLE_RSS_MB = int(os.environ.get('MEMORY_RECYCLE_RSS_MB', 0))
+    MEMORY_TRACE_FRAMES = 1
+    MEMORY_TOP_N = 20
+    MEMORY_HISTORY_SIZE = 120
+    
+    # Idempotency-Key sur /api/chat
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+    IDEMPOTENCY_PENDING_TIMEOUT = 90
+    IDEMPOTENCY_WAIT_TIMEOUT = int(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 60))
+    IDEMPOTENCY_POLL_INTERVAL = 0.25
+    IDEMPOTENCY_MAX_KEYS_PER_USER = int(os.environ.get('IDEMPOTENCY_MAX_KEYS_PER_USER', 1000))
+    IDEMPOTENCY_PURGE_INTERVAL = 300
@@ -0,0 +1,87 @@
+# backend/dashboard_service.py
+import time
+import threading
+from sqlalchemy import func
+
+from backend.models import db, APIUsage, UsageDaily
+from backend.config import Config
+
+class DashboardService:
+    """Données du tableau de bord en une réponse, mises en cache par utilisateur.
+
+    Deux requêtes SQL au plus (usage récent + totaux lus dans usage_daily) ;
+    le résultat est gardé DASHBOARD_CACHE_TTL secondes et invalidé par la
+    régénération de clé, les récompenses pub et chaque nouvel usage.
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def recent_usage(user_id, limit):
+        rows = db.session.execute(
+            db.select(
+                APIUsage.id,
+                APIUsage.model,
+                func.substr(APIUsage.prompt, 1, 50).label('prompt'),
+                APIUsage.tokens_used,
+                APIUsage.created_at
+            ).where(APIUsage.user_id == user_id)
+            .order_by(APIUsage.created_at.desc())
+            .limit(limit)
+        )
+        return [{
+            'id': r.id,
+            'model': r.model,
+            'prompt': r.prompt or '',
+            'tokens': r.tokens_used,
+            'created_at': str(r.created_at)
+        } for r in rows]
+
+    @staticmethod
+    def usage_totals(user_id):
+        row = db.session.execute(
+            db.select(
+                func.coalesce(func.sum(UsageDaily.requests), 0),
+                func.coalesce(func.sum(UsageDaily.tokens_used), 0),
+                func.coalesce(func.sum(UsageDaily.errors), 0),
+                func.coalesce(func.sum(UsageDaily.aborted), 0)
+            ).where(UsageDaily.user_id == user_id)
+        ).one()
+        return {'requests': int(row[0]), 'tokens_used': int(row[1]),
+                'errors': int(row[2]), 'aborted': int(row[3])}
+
+    @classmethod
+    def get(cls, user, ads_payload):
+        now = time.monotonic()
+        cached = cls._cache.get(user.id)
+        if cached and cached[1] > now:
+            return cached[0]
+        
+        keys_generated = user.api_keys_generated or 1
+        max_keys = user.max_api_keys or 5
+        data = {
+            'user': {'username': user.username, 'email': user.email},
+            'keys': {
+                'api_key': user.api_key,
+                'created_at': str(user.created_at),
+                'keys_generated': keys_generated,
+                'max_keys': max_keys,
+                'keys_remaining': max_keys - keys_generated
+            },
+            'usage': {
+                'recent': cls.recent_usage(user.id, Config.DASHBOARD_RECENT_USAGE),
+                'totals': cls.usage_totals(user.id)
+            },
+            'ads': ads_payload
+        }
+        
+        with cls._lock:
+            if len(cls._cache) >= Config.DASHBOARD_CACHE_MAX_SIZE:
+                cls._cache = {k: v for k, v in cls._cache.items() if v[1] > now}
+            cls._cache[user.id] = (data, now + Config.DASHBOARD_CACHE_TTL)
+        return data
+
+    @classmethod
+    def invalidate(cls, user_id):
+        with cls._lock:
+            cls._cache.pop(user_id, None)
@@ -0,0 +1,113 @@
+# backend/db_routing.py
+import time
+import itertools
+import threading
+import logging
+from flask import g, session, has_app_context, has_request_context, request, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class ReplicaRouter:
+    """Choix d'un réplica en lecture (tourniquet), en écartant ceux en retard.
+
+    Le retard de chaque réplica est mesuré au plus toutes les
+    REPLICA_LAG_CHECK_INTERVAL secondes ; au-delà de REPLICA_MAX_LAG
+    secondes (ou si la mesure échoue) les lectures vont au primaire.
+    """
+
+    def __init__(self):
+        self._lag = {}
+        self._cycle = None
+        self._keys = ()
+        self._lock = threading.Lock()
+
+    def bind_keys(self):
+        return [f"replica_{i}" for i in range(len(Config.DATABASE_REPLICA_URLS))]
+
+    def _measure_lag(self, engine):
+        if engine.dialect.name != 'postgresql':
+            return 0.0
+        with engine.connect() as conn:
+            return float(conn.execute(REPLICA_LAG_SQL).scalar() or 0)
+
+    def lag(self, key, engine):
+        now = time.monotonic()
+        cached = self._lag.get(key)
+        if cached and now - cached[1] < Config.REPLICA_LAG_CHECK_INTERVAL:
+            return cached[0]
+        try:
+            lag = self._measure_lag(engine)
+        except Exception as e:
+            logger.warning("Réplica %s injoignable: %s", key, e)
+            lag = float('inf')
+        self._lag[key] = (lag, now)
+        return lag
+
+    def pick(self, engines):
+        keys = [k for k in self.bind_keys() if k in engines]
+        if not keys:
+            return None
+        with self._lock:
+            if self._keys != tuple(keys):
+                self._keys = tuple(keys)
+                self._cycle = itertools.cycle(keys)
+            order = [next(self._cycle) for _ in keys]
+        for key in order:
+            if self.lag(key, engines[key]) <= Config.REPLICA_MAX_LAG:
+                return engines[key]
+        return None
+
+    def stats(self):
+        return {k: {'lag': v[0]} for k, v in self._lag.items()}
+
+replica_router = ReplicaRouter()
+
+def wants_replica():
+    """Lecture seule demandée par la route et pas d'écriture récente de l'utilisateur"""
+    if not has_app_context() or not g.get('db_read_replica'):
+        return False
+    if has_request_context() and session.get('db_primary_until', 0) > time.time():
+        return False
+    return True
+
+class RoutingSession(Session):
+    """Session qui envoie les SELECT des routes en lecture seule aux réplicas"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) and wants_replica():
+            engine = replica_router.pick(self._db.engines)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_replica(view):
+    """Marque une route comme lisible depuis un réplica"""
+    view._read_replica = True
+    return view
+
+def mark_primary_reads():
+    """Read-your-writes : les lectures de cet utilisateur restent sur le primaire un moment"""
+    if has_request_context():
+        session['db_primary_until'] = time.time() + Config.REPLICA_READ_YOUR_WRITES_SECONDS
+
+def init_db_routing(app):
+    """Déclare les réplicas comme binds et active le routage par route"""
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for key, url in zip(replica_router.bind_keys(), Config.DATABASE_REPLICA_URLS):
+        binds[key] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    
+    @app.before_request
+    def flag_read_replica():
+        view = current_app.view_functions.get(request.endpoint)
+        g.db_read_replica = bool(view is not None and getattr(view, '_read_replica', False))
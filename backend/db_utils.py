@@ -0,0 +1,55 @@
+# backend/db_utils.py
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend.models import db
+
+def upsert_increment(model, keys, increments):
+    """INSERT ... ON CONFLICT DO UPDATE col = col + valeur, sans commit.
+
+    keys : colonnes de la contrainte unique et leurs valeurs.
+    increments : colonnes compteurs et la valeur à ajouter.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(model).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={col: getattr(model, col) + getattr(stmt.excluded, col) for col in increments}
+        )
+        db.session.execute(stmt)
+        return
+    
+    updated = model.query.filter_by(**keys).update(
+        {getattr(model, col): getattr(model, col) + value for col, value in increments.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(model(**keys, **increments))
+
+def upsert_from_select(model, keys, columns, select):
+    """INSERT ... SELECT ... ON CONFLICT DO UPDATE col = valeur, sans commit.
+
+    select renvoie les colonnes keys puis columns, dans cet ordre. Sur une
+    ligne existante seules `columns` sont remplacées, les autres compteurs
+    sont conservés.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(model).from_select(list(keys) + list(columns), select)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={col: getattr(stmt.excluded, col) for col in columns}
+        )
+        return db.session.execute(stmt).rowcount
+    
+    count = 0
+    for row in db.session.execute(select).all():
+        key_values = dict(zip(keys, row[:len(keys)]))
+        values = dict(zip(columns, row[len(keys):]))
+        updated = model.query.filter_by(**key_values).update(values, synchronize_session=False)
+        if not updated:
+            db.session.add(model(**key_values, **values))
+        count += 1
+    return count
@@ -1,29 +1,19 @@
 from flask_mail import Mail, Message
+import os
+import queue
+import threading
+import time
 import logging
 
+from backend.config import Config
+
 logger = logging.getLogger(__name__)
 
-class EmailService:
-    def __init__(self, app=None):
-        self.mail = None
-        self._app = None
-        if app:
-            self.init_app(app)
-    
-    def init_app(self, app):
-        self._app = app
-        self.mail = Mail(app)
-        logger.info("Service email initialise")
-    
-    def send_otp(self, email, code, purpose):
-        try:
-            if not self.mail:
-                logger.error("Service email non initialise")
-                return False
-            
-            if purpose == "verification":
-                subject = "Open Always - Code de verification"
-                html_body = f"""
+# Gabarits pré-rendus : seul le code est substitué à l'envoi
+OTP_TEMPLATES = {
+    "verification": {
+        "subject": "Open Always - Code de verification",
+        "html": """
                 <div style="font-family: 'Segoe UI', sans-serif; max-width: 500px; margin: 0 auto; padding: 2rem;">
                     <div style="text-align: center; margin-bottom: 2rem;">
                         <h1 style="color: #0ea5e9; font-size: 1.5rem;">Open Always</h1>
@@ -31,14 +21,15 @@ class EmailService:
                     <h2 style="color: #1e293b;">Verification de votre email</h2>
                     <p style="color: #475569;">Bienvenue ! Utilisez le code ci-dessous pour verifier votre compte :</p>
                     <div style="text-align: center; margin: 2rem 0;">
-                        <span style="background: #f0f9ff; border: 2px solid #0ea5e9; color: #0369a1; padding: 1rem 2rem; font-size: 2rem; font-weight: bold; letter-spacing: 0.3em; border-radius: 12px; display: inline-block;">{code}</span>
+                        <span style="background: #f0f9ff; border: 2px solid #0ea5e9; color: #0369a1; padding: 1rem 2rem; font-size: 2rem; font-weight: bold; letter-spacing: 0.3em; border-radius: 12px; display: inline-block;">%(code)s</span>
                     </div>
                     <p style="color: #94a3b8; font-size: 0.875rem;">Ce code expire dans 10 minutes.</p>
                 </div>
                 """
-            elif purpose == "reset":
-                subject = "Open Always - Reinitialisation mot de passe"
-                html_body = f"""
+    },
+    "reset": {
+        "subject": "Open Always - Reinitialisation mot de passe",
+        "html": """
                 <div style="font-family: 'Segoe UI', sans-serif; max-width: 500px; margin: 0 auto; padding: 2rem;">
                     <div style="text-align: center; margin-bottom: 2rem;">
                         <h1 style="color: #0ea5e9; font-size: 1.5rem;">Open Always</h1>
@@ -46,27 +37,174 @@ class EmailService:
                     <h2 style="color: #1e293b;">Reinitialisation du mot de passe</h2>
                     <p style="color: #475569;">Voici votre code de reinitialisation :</p>
                     <div style="text-align: center; margin: 2rem 0;">
-                        <span style="background: #fff7ed; border: 2px solid #f97316; color: #c2410c; padding: 1rem 2rem; font-size: 2rem; font-weight: bold; letter-spacing: 0.3em; border-radius: 12px; display: inline-block;">{code}</span>
+                        <span style="background: #fff7ed; border: 2px solid #f97316; color: #c2410c; padding: 1rem 2rem; font-size: 2rem; font-weight: bold; letter-spacing: 0.3em; border-radius: 12px; display: inline-block;">%(code)s</span>
                     </div>
                     <p style="color: #94a3b8; font-size: 0.875rem;">Ce code expire dans 10 minutes. Si vous n'avez pas demande cette reinitialisation, ignorez cet email.</p>
                 </div>
                 """
-            else:
+    }
+}
+
+class MailDispatcher:
+    """Envoi des emails en arrière-plan.
+
+    Les messages passent par une file bornée ; un thread par worker les
+    envoie par lots sur une connexion SMTP réutilisée, fermée après
+    MAIL_IDLE_TIMEOUT secondes d'inactivité, avec reprise exponentielle
+    en cas d'erreur.
+    """
+
+    def __init__(self, mail, app):
+        self.mail = mail
+        self.app = app
+        self.queue = queue.Queue(maxsize=Config.MAIL_QUEUE_SIZE)
+        self._connection = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        # Les threads ne survivent pas au fork de gunicorn : un par processus
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(maxsize=Config.MAIL_QUEUE_SIZE)
+                self._connection = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, msg):
+        """Ajoute un message à la file, False si elle est pleine"""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(msg)
+            return True
+        except queue.Full:
+            logger.error("File d'envoi email pleine")
+            return False
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    msg = self.queue.get(timeout=Config.MAIL_IDLE_TIMEOUT)
+                except queue.Empty:
+                    self._disconnect()
+                    continue
+                
+                batch = [msg]
+                while len(batch) < Config.MAIL_BATCH_SIZE:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                for msg in batch:
+                    self._send_with_retry(msg)
+                    self.queue.task_done()
+
+    def _send_with_retry(self, msg):
+        for attempt in range(Config.MAIL_MAX_RETRIES + 1):
+            try:
+                self._connect().send(msg)
+                self.sent += 1
+                logger.info("Email envoye a %s", ', '.join(msg.recipients))
+                return True
+            except Exception as e:
+                self._disconnect()
+                if attempt == Config.MAIL_MAX_RETRIES:
+                    # Le code n'a pas été renvoyé à l'appelant : l'utilisateur doit
+                    # en redemander un (/auth/resend-otp)
+                    self.failed += 1
+                    logger.error("Erreur envoi email a %s: %s", ', '.join(msg.recipients), e)
+                    return False
+                delay = Config.MAIL_RETRY_BACKOFF * (2 ** attempt)
+                logger.warning("Echec envoi email (tentative %s), nouvel essai dans %ss: %s", attempt + 1, delay, e)
+                time.sleep(delay)
+
+    def _connect(self):
+        if self._connection is None:
+            connection = self.mail.connect()
+            self._connection = connection.__enter__()
+        return self._connection
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception:
+                pass
+            self._connection = None
+
+    def shutdown(self, timeout):
+        """Arrêt du worker : laisse jusqu'à `timeout` secondes aux emails en file"""
+        if self._pid != os.getpid() or not self._thread or not self._thread.is_alive():
+            return True
+        if not self.flush(timeout):
+            logger.error("%s email(s) perdu(s) à l'arrêt du worker", self.queue.unfinished_tasks)
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """Attend que la file soit vide (tests, arrêt du worker)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+class EmailService:
+    def __init__(self, app=None):
+        self.mail = None
+        self._app = None
+        self.dispatcher = None
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self._app = app
+        self.mail = Mail(app)
+        self.dispatcher = MailDispatcher(self.mail, app)
+        logger.info("Service email initialise")
+    
+    def send_otp(self, email, code, purpose):
+        """Met le code en file d'envoi, retourne False si l'email ne partira pas.
+
+        True signifie seulement « mis en file » : un échec SMTP ultérieur n'est
+        connu que du dispatcher, et l'otp_code de secours n'est renvoyé que
+        pour les refus immédiats (SMTP non configuré, file pleine).
+        """
+        try:
+            if not self.mail:
+                logger.error("Service email non initialise")
+                return False
+            
+            template = OTP_TEMPLATES.get(purpose)
+            if not template:
+                return False
+            
+            if not self._app.config.get('MAIL_USERNAME') and not self._app.config.get('MAIL_SUPPRESS_SEND'):
+                logger.warning("MAIL_USERNAME non configure - email non envoye a %s", email)
                 return False
             
             msg = Message(
-                subject=subject,
+                subject=template["subject"],
                 recipients=[email],
-                html=html_body,
+                html=template["html"] % {"code": code},
                 body=f"Votre code : {code} (expire dans 10 minutes)"
             )
             
-            self.mail.send(msg)
-            logger.info(f"Email envoye a {email}")
-            return True
+            return self.dispatcher.submit(msg)
             
         except Exception as e:
-            logger.error(f"Erreur envoi email a {email}: {e}")
+            logger.error("Erreur envoi email a %s: %s", email, e)
             return False
     
     def send_test(self, recipient):
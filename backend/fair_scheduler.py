@@ -0,0 +1,187 @@
+# backend/fair_scheduler.py
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from backend.config import Config
+from backend.cancellation import ABORTED
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FULL = "Trop de requetes en attente"
+QUEUE_TIMEOUT = "File d'attente saturee - reessayez"
+
+class SchedulerRejected(Exception):
+    """Requête refusée par l'ordonnanceur (file pleine, délai dépassé ou annulation)"""
+
+class _Waiter:
+    __slots__ = ('tag', 'event', 'granted', 'enqueued_at')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+class _UserQueue:
+    __slots__ = ('waiters', 'last_finish')
+
+    def __init__(self):
+        self.waiters = deque()
+        self.last_finish = 0.0
+
+class FairScheduler:
+    """File équitable pondérée (start-time fair queuing) devant les upstreams.
+
+    Au plus `slots` appels upstream en parallèle par worker. Quand tout est
+    occupé, chaque utilisateur a sa propre file bornée ; à chaque créneau
+    libéré on sert la tête de file de plus petite étiquette virtuelle, qui
+    avance de 1/poids par requête. Un utilisateur qui envoie cent requêtes
+    d'un coup n'en fait donc passer qu'une par tour, et sans concurrence il
+    utilise toute la capacité.
+    """
+
+    def __init__(self, slots, queue_size, timeout):
+        self.slots = slots
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.available = slots
+        self.vtime = 0.0
+        self.users = {}
+        self._lock = threading.Lock()
+        self.dispatched = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.waits = {}         # poids -> [nombre, attente totale, attente max]
+
+    @staticmethod
+    def weight_for(user):
+        """Poids selon le palier : vérifié, puis +1 par tranche de clés gagnées"""
+        if user is None:
+            return Config.CHAT_WEIGHT_UNVERIFIED
+        weight = Config.CHAT_WEIGHT_VERIFIED if user.is_verified else Config.CHAT_WEIGHT_UNVERIFIED
+        extra_keys = max(0, (user.max_api_keys or 5) - 5)
+        return weight + extra_keys // Config.CHAT_WEIGHT_KEYS_STEP
+
+    @contextmanager
+    def slot(self, user_id, weight=1, cancel=None):
+        self.acquire(user_id, weight, cancel)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, user_id, weight=1, cancel=None):
+        with self._lock:
+            if self.available > 0:
+                # Des créneaux libres impliquent des files vides
+                self.available -= 1
+                self._record_wait(weight, 0.0)
+                return
+            
+            queue = self.users.get(user_id)
+            if queue is None:
+                queue = self.users[user_id] = _UserQueue()
+            if len(queue.waiters) >= self.queue_size:
+                self.rejected += 1
+                raise SchedulerRejected(QUEUE_FULL)
+            
+            tag = max(self.vtime, queue.last_finish) + 1.0 / max(weight, 1)
+            queue.last_finish = tag
+            waiter = _Waiter(tag)
+            queue.waiters.append(waiter)
+        
+        remove = cancel.on_cancel(waiter.event.set) if cancel is not None else None
+        waiter.event.wait(self.timeout)
+        if remove:
+            remove()
+        
+        with self._lock:
+            if waiter.granted:
+                if cancel is not None and cancel.cancelled:
+                    # Créneau obtenu trop tard : on le rend aussitôt
+                    self.cancelled += 1
+                    self._release_locked()
+                    raise SchedulerRejected(ABORTED)
+                self._record_wait(weight, time.monotonic() - waiter.enqueued_at)
+                return
+            
+            self._withdraw_locked(user_id, queue, waiter, weight)
+            if cancel is not None and cancel.cancelled:
+                self.cancelled += 1
+                raise SchedulerRejected(ABORTED)
+            self.timeouts += 1
+            logger.warning("Attente ordonnanceur dépassée (%ss) pour l'utilisateur %s", self.timeout, user_id)
+            raise SchedulerRejected(QUEUE_TIMEOUT)
+
+    def release(self):
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        best = None
+        for user_id, queue in self.users.items():
+            if queue.waiters and (best is None or queue.waiters[0].tag < best[1].waiters[0].tag):
+                best = (user_id, queue)
+        if best is None:
+            self.available += 1
+            return
+        
+        user_id, queue = best
+        waiter = queue.waiters.popleft()
+        self.vtime = waiter.tag
+        self._forget_idle(user_id, queue)
+        # Le créneau passe directement au suivant
+        waiter.granted = True
+        waiter.event.set()
+
+    def _withdraw_locked(self, user_id, queue, waiter, weight):
+        """Retire un waiter jamais servi (délai ou annulation) sans laisser
+        son étiquette pénaliser les requêtes suivantes de l'utilisateur"""
+        index = queue.waiters.index(waiter)
+        del queue.waiters[index]
+        cost = 1.0 / max(weight, 1)
+        for later in list(queue.waiters)[index:]:
+            later.tag -= cost
+        queue.last_finish = queue.waiters[-1].tag if queue.waiters else self.vtime
+        self._forget_idle(user_id, queue)
+
+    def _forget_idle(self, user_id, queue):
+        if not queue.waiters and queue.last_finish <= self.vtime:
+            self.users.pop(user_id, None)
+
+    def _record_wait(self, weight, waited):
+        self.dispatched += 1
+        entry = self.waits.setdefault(weight, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += waited
+        entry[2] = max(entry[2], waited)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'in_use': self.slots - self.available,
+                'queued': sum(len(q.waiters) for q in self.users.values()),
+                'users_waiting': sum(1 for q in self.users.values() if q.waiters),
+                'dispatched': self.dispatched,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'cancelled': self.cancelled,
+                'wait_by_weight': {
+                    str(weight): {
+                        'count': count,
+                        'avg_ms': round(total / count * 1000, 1) if count else 0.0,
+                        'max_ms': round(longest * 1000, 1)
+                    } for weight, (count, total, longest) in sorted(self.waits.items())
+                }
+            }
+
+chat_scheduler = FairScheduler(
+    Config.CHAT_SCHEDULER_SLOTS,
+    Config.CHAT_USER_QUEUE_SIZE,
+    Config.CHAT_QUEUE_TIMEOUT
+)
@@ -13,8 +13,8 @@ def init_google_app(app):
         client_secret = app.config.get('GOOGLE_CLIENT_SECRET')
         
         logger.info("Initialisation Google OAuth...")
-        logger.info(f"Client ID present: {'OUI' if client_id else 'NON'}")
-        logger.info(f"Client Secret present: {'OUI' if client_secret else 'NON'}")
+        logger.info("Client ID present: %s", 'OUI' if client_id else 'NON')
+        logger.info("Client Secret present: %s", 'OUI' if client_secret else 'NON')
         
         if not client_id or not client_secret:
             logger.error("GOOGLE_CLIENT_ID ou GOOGLE_CLIENT_SECRET manquant")
@@ -34,7 +34,7 @@ def init_google_app(app):
         return google
         
     except Exception as e:
-        logger.error(f"Erreur initialisation Google: {e}")
+        logger.error("Erreur initialisation Google: %s", e)
         logger.error(traceback.format_exc())
         return None
 
@@ -0,0 +1,59 @@
+# backend/housekeeping.py
+import time
+import threading
+import logging
+from flask import current_app, g, has_request_context, appcontext_tearing_down
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class PeriodicTask:
+    """Tâche d'entretien (purge, partitions) lancée au plus une fois par
+    intervalle et par worker, jamais dans la transaction de l'appelant.
+
+    La tâche tourne dans son propre contexte d'application, donc avec sa
+    propre session SQLAlchemy. Pendant une requête elle est repoussée après
+    la fermeture de la session de la requête, pour ne pas attendre un verrou
+    que celle-ci détient ; ailleurs (threads de jobs, WebSocket) elle
+    s'exécute tout de suite.
+    """
+
+    def __init__(self, name, interval_setting, func):
+        self.name = name
+        self.interval_setting = interval_setting
+        self.func = func
+        self._last_run = None
+        self._lock = threading.Lock()
+
+    def _due(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._last_run is not None and now - self._last_run < getattr(Config, self.interval_setting):
+                return False
+            self._last_run = now
+            return True
+
+    def maybe_run(self):
+        if not self._due():
+            return False
+        if has_request_context():
+            g.setdefault('_housekeeping', []).append(self)
+        else:
+            self.run(current_app._get_current_object())
+        return True
+
+    def run(self, app):
+        try:
+            with app.app_context():
+                return self.func()
+        except Exception as e:
+            logger.error("Erreur tâche d'entretien %s: %s", self.name, e)
+
+def _run_deferred(app, **kwargs):
+    # Signal émis après tous les teardown_appcontext, session de la requête comprise
+    for task in g.pop('_housekeeping', []):
+        task.run(app)
+
+def init_housekeeping(app):
+    appcontext_tearing_down.connect(_run_deferred, app)
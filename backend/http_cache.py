@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import logging
+from flask import Response, request, current_app
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class CachedPayload:
+    """Corps de réponse pré-sérialisé avec son ETag fort"""
+
+    def __init__(self, body, mimetype, max_age):
+        self.body = body if isinstance(body, bytes) else body.encode('utf-8')
+        self.mimetype = mimetype
+        self.max_age = max_age
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+    def to_response(self):
+        """Répond 304 si le client a déjà la bonne version, sinon le corps"""
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.body, mimetype=self.mimetype)
+        response.set_etag(self.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response
+
+class PayloadCache:
+    """Registre des réponses statiques (modèles, pubs, docs, pages HTML).
+
+    Les corps sont construits une seule fois par worker. Leurs sources
+    (ADS_DATABASE, modèles, gabarits HTML) sont dans le code : elles ne
+    changent qu'au déploiement, et c'est le redémarrage des workers
+    (`kill -HUP` du maître gunicorn) qui reconstruit le cache. invalidate()
+    ne vide que le worker courant (scripts, shell Flask).
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, builder, mimetype='application/json', max_age=None):
+        payload = self._payloads.get(name)
+        if payload is None:
+            body = builder()
+            if mimetype == 'application/json' and not isinstance(body, (str, bytes)):
+                body = current_app.json.dumps(body) + "\n"
+            payload = CachedPayload(body, mimetype,
+                                    Config.PAYLOAD_CACHE_MAX_AGE if max_age is None else max_age)
+            with self._lock:
+                if len(self._payloads) >= self.max_entries:
+                    # /api/docs est indexé par hôte : on borne la mémoire
+                    prefix = name.split(':', 1)[0] + ':'
+                    for key in [k for k in self._payloads if k.startswith(prefix)]:
+                        del self._payloads[key]
+                self._payloads[name] = payload
+        return payload
+
+    def respond(self, name, builder, mimetype='application/json', max_age=None):
+        return self.get(name, builder, mimetype, max_age).to_response()
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._payloads.clear()
+            else:
+                for key in [k for k in self._payloads if k == name or k.startswith(name + ':')]:
+                    del self._payloads[key]
+        logger.info("Cache des réponses invalidé: %s", name or 'tout')
+
+payload_cache = PayloadCache()
@@ -0,0 +1,126 @@
+# backend/idempotency_service.py
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+from backend.models import db, IdempotencyKey
+from backend.config import Config
+from backend.housekeeping import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+class IdempotencyError(Exception):
+    """Clé réutilisée pour une autre requête, ou requête identique toujours en cours"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class IdempotencyService:
+    """Idempotency-Key pour /api/chat, partagée entre workers via la base.
+
+    La première requête réserve la clé (ligne 'pending'), les répétitions
+    attendent sa fin puis reçoivent la réponse enregistrée pendant
+    IDEMPOTENCY_TTL secondes. Seules les réponses 200 sont gardées : après
+    une erreur la clé est libérée et une nouvelle tentative repart de zéro.
+    Une réservation dont le worker a disparu expire après
+    IDEMPOTENCY_PENDING_TIMEOUT secondes.
+    """
+    @staticmethod
+    def fingerprint(model, message):
+        return hashlib.sha256(json.dumps([model, message]).encode()).hexdigest()
+
+    @staticmethod
+    def begin(user_id, key, fingerprint):
+        """None si la clé est réservée pour cette requête, sinon (corps, code) enregistrés"""
+        IdempotencyService.maybe_purge()
+        deadline = time.monotonic() + Config.IDEMPOTENCY_WAIT_TIMEOUT
+        
+        while True:
+            now = datetime.utcnow()
+            entry = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+            
+            if entry is None or entry.expires_at < now:
+                if entry is not None:
+                    # DELETE immédiat : l'unit of work insérerait avant de supprimer
+                    db.session.expunge(entry)
+                    IdempotencyKey.query.filter_by(id=entry.id).delete(synchronize_session=False)
+                db.session.add(IdempotencyKey(
+                    user_id=user_id,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=Config.IDEMPOTENCY_PENDING_TIMEOUT)
+                ))
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # Un autre worker vient de réserver la même clé
+                    db.session.rollback()
+                    continue
+                IdempotencyService.enforce_limit(user_id)
+                return None
+            
+            if entry.fingerprint != fingerprint:
+                db.session.rollback()
+                raise IdempotencyError("Idempotency-Key deja utilisee pour une autre requete", 422)
+            
+            if entry.status == 'done':
+                stored = (json.loads(entry.body), entry.status_code)
+                db.session.rollback()
+                return stored
+            
+            # En cours ailleurs : on relâche la connexion pendant l'attente
+            db.session.rollback()
+            if time.monotonic() >= deadline:
+                raise IdempotencyError("Requete identique deja en cours", 409)
+            time.sleep(Config.IDEMPOTENCY_POLL_INTERVAL)
+
+    @staticmethod
+    def complete(user_id, key, body, status_code=200):
+        """Enregistre la réponse pour les répétitions à venir"""
+        IdempotencyKey.query.filter_by(user_id=user_id, key=key, status='pending').update({
+            'status': 'done',
+            'status_code': status_code,
+            'body': json.dumps(body),
+            'expires_at': datetime.utcnow() + timedelta(seconds=Config.IDEMPOTENCY_TTL)
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def release(user_id, key):
+        """Libère une réservation sans réponse à rejouer (erreur, annulation)"""
+        IdempotencyKey.query.filter_by(user_id=user_id, key=key, status='pending')\
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def enforce_limit(user_id):
+        """Au plus IDEMPOTENCY_MAX_KEYS_PER_USER clés : les plus anciennes terminées partent"""
+        excess = IdempotencyKey.query.filter_by(user_id=user_id).count() - Config.IDEMPOTENCY_MAX_KEYS_PER_USER
+        if excess <= 0:
+            return 0
+        ids = [row.id for row in db.session.query(IdempotencyKey.id).filter_by(user_id=user_id, status='done')
+               .order_by(IdempotencyKey.created_at).limit(excess)]
+        if ids:
+            IdempotencyKey.query.filter(IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        return len(ids)
+
+    @staticmethod
+    def maybe_purge():
+        """Purge au plus une fois par IDEMPOTENCY_PURGE_INTERVAL secondes et par worker"""
+        return _purge_task.maybe_run()
+
+    @staticmethod
+    def purge_expired():
+        deleted = IdempotencyKey.query.filter(IdempotencyKey.expires_at < datetime.utcnow())\
+            .delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            logger.info("%s clés d'idempotence expirées purgées", deleted)
+        return deleted
+
+_purge_task = PeriodicTask('idempotency', 'IDEMPOTENCY_PURGE_INTERVAL', IdempotencyService.purge_expired)
@@ -1,7 +1,8 @@
 # backend/keys_service.py
 import secrets
 from datetime import datetime
-from backend.models import db, APIKey
+from flask import g
+from backend.models import db, APIKey, User
 
 class KeysService:
     @staticmethod
@@ -16,6 +17,7 @@ class KeysService:
         if key_record:
             key_record.last_used = datetime.utcnow()
             db.session.commit()
+            g.api_key_id = key_record.id
             return key_record.user
         
         return None
@@ -46,3 +48,24 @@ class KeysService:
         """Désactive une clé API"""
         key.is_active = False
         return key
+    
+    @staticmethod
+    def regenerate(user_id):
+        """Remplace la clé active ; None si la limite est atteinte (sans commit).
+
+        Relit l'utilisateur verrouillé : le snapshot de user_cache peut dater
+        de USER_CACHE_TTL secondes et avoir été modifié par un autre worker.
+        """
+        user = User.query.filter_by(id=user_id).with_for_update().populate_existing().one()
+        keys_generated = user.api_keys_generated or 1
+        if keys_generated >= (user.max_api_keys or 5):
+            db.session.rollback()
+            return None
+        
+        APIKey.query.filter_by(user_id=user_id, is_active=True)\
+            .update({'is_active': False}, synchronize_session=False)
+        
+        user.api_key = KeysService.generate_key()
+        user.api_keys_generated = keys_generated + 1
+        KeysService.create_key(user_id, user.api_key)
+        return user
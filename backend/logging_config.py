@@ -0,0 +1,103 @@
+# backend/logging_config.py
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from flask import has_request_context, request
+
+from backend.config import Config
+
+_SIMPLE_ARGS = (str, int, float, bool, type(None))
+
+class RouteSampler(logging.Filter):
+    """Ne garde qu'une fraction des lignes INFO/DEBUG des routes très sollicitées.
+
+    LOG_SAMPLE_RATES : "chat=0.05,check_auth=0.1" (nom d'endpoint Flask -> taux).
+    Les WARNING et au-delà passent toujours.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        record.endpoint = request.endpoint if has_request_context() else None
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.endpoint)
+        return rate is None or random.random() < rate
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui laisse le formatage au thread d'écriture.
+
+    Le QueueHandler standard formate le message dans le thread appelant ;
+    ici seuls les arguments non triviaux (objets ORM, exceptions...) sont
+    convertis en texte avant de changer de thread.
+    """
+
+    dropped = 0
+
+    def enqueue(self, record):
+        # File pleine : on perd la ligne plutôt que de bloquer la requête
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LazyQueueHandler.dropped += 1
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        if record.args and not all(isinstance(a, _SIMPLE_ARGS) for a in
+                                   (record.args.values() if isinstance(record.args, dict) else record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'endpoint', None):
+            data['endpoint'] = record.endpoint
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+def parse_sample_rates(value):
+    rates = {}
+    for entry in (value or '').split(','):
+        if '=' in entry:
+            endpoint, rate = entry.split('=', 1)
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+def setup_logging():
+    """File d'attente + thread d'écriture ; retourne le QueueListener"""
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    
+    stream_handler = logging.StreamHandler()
+    if Config.LOG_FORMAT == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+    
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(RouteSampler(parse_sample_rates(Config.LOG_SAMPLE_RATES)))
+    
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(Config.LOG_LEVEL)
+    
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,206 @@
+# backend/memory_profiler.py
+import gc
+import os
+import sys
+import hmac
+import time
+import signal
+import resource
+import threading
+import tracemalloc
+import logging
+from collections import deque
+from functools import wraps
+from flask import request, jsonify, abort
+from sqlalchemy.orm import Session
+
+try:
+    # Registre interne des sessions vivantes : évite un parcours du gc
+    from sqlalchemy.orm.session import _sessions
+except ImportError:
+    _sessions = None
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Allocations du profileur lui-même et des imports, sans intérêt pour une fuite
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+def rss_bytes():
+    """RSS courant (Linux) ; à défaut le pic fourni par getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def sqlalchemy_identity_maps():
+    """Sessions SQLAlchemy vivantes et objets retenus dans leurs identity maps"""
+    if _sessions is not None:
+        sessions = list(_sessions.values())
+    else:
+        # API publique seulement : plus lent, réservé au diagnostic
+        sessions = [o for o in gc.get_objects() if isinstance(o, Session)]
+    return {'sessions': len(sessions), 'objects': sum(len(s.identity_map) for s in sessions)}
+
+def _mb(value):
+    return round(value / (1024 * 1024), 1)
+
+def _format_stats(stats, limit):
+    return [{
+        'where': str(stat.traceback[0]) if stat.traceback else '?',
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+        **({'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff}
+           if hasattr(stat, 'size_diff') else {})
+    } for stat in stats[:limit]]
+
+class MemoryProfiler:
+    """Mesures mémoire par worker, activées par MEMORY_PROFILING.
+
+    Un thread par processus relève le RSS toutes les MEMORY_SAMPLE_INTERVAL
+    secondes et, en mode profilage, prend un instantané tracemalloc comparé
+    au précédent et au premier (ce qui grossit sans jamais redescendre est
+    un candidat à la fuite). Au-delà de MEMORY_RECYCLE_RSS_MB, le worker
+    demande à gunicorn d'être remplacé.
+    """
+
+    def __init__(self):
+        self.enabled = Config.MEMORY_PROFILING
+        self.recycle_bytes = Config.MEMORY_RECYCLE_RSS_MB * 1024 * 1024
+        self.rss_history = deque(maxlen=Config.MEMORY_HISTORY_SIZE)
+        self.gauges = {}
+        self.baseline = None
+        self.previous = None
+        self.latest = None
+        self.recycling = False
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def track(self, name, func):
+        """Expose la taille d'un état en mémoire (cache, compteurs...)"""
+        self.gauges[name] = func
+
+    def ensure_started(self):
+        if not self.enabled and not self.recycle_bytes:
+            return
+        # Les threads ne survivent pas au fork de gunicorn : un par processus
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self.rss_history.clear()
+                self.baseline = self.previous = self.latest = None
+            if self.enabled and not tracemalloc.is_tracing():
+                tracemalloc.start(Config.MEMORY_TRACE_FRAMES)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='memory-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error("Erreur profilage mémoire: %s", e)
+            time.sleep(Config.MEMORY_SAMPLE_INTERVAL)
+
+    def sample(self):
+        rss = rss_bytes()
+        self.rss_history.append((round(time.time()), rss))
+        
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            with self._lock:
+                if self.baseline is None:
+                    self.baseline = snapshot
+                self.previous, self.latest = self.latest, snapshot
+        
+        if self.recycle_bytes and rss > self.recycle_bytes and not self.recycling:
+            self._recycle(rss)
+
+    def _recycle(self, rss):
+        # Le SIGTERM déclenche l'arrêt gracieux du worker ; l'arbitre en relance un
+        if 'gunicorn.arbiter' not in sys.modules:
+            logger.warning("RSS %s Mo au-delà du seuil, recyclage ignoré hors gunicorn", _mb(rss))
+            return
+        self.recycling = True
+        logger.warning("RSS %s Mo au-delà de %s Mo, recyclage du worker %s",
+                       _mb(rss), Config.MEMORY_RECYCLE_RSS_MB, os.getpid())
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def report(self, limit):
+        rss = rss_bytes()
+        data = {
+            'pid': os.getpid(),
+            'rss_mb': _mb(rss),
+            'peak_rss_mb': _mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss *
+                               (1 if sys.platform == 'darwin' else 1024)),
+            'recycle_rss_mb': Config.MEMORY_RECYCLE_RSS_MB or None,
+            'rss_history_mb': [[ts, _mb(value)] for ts, value in self.rss_history],
+            'gc': {'counts': gc.get_count(), 'objects': len(gc.get_objects())},
+            'state': {},
+            'profiling': tracemalloc.is_tracing()
+        }
+        for name, func in self.gauges.items():
+            try:
+                data['state'][name] = func()
+            except Exception as e:
+                data['state'][name] = f"erreur: {e}"
+        
+        if not tracemalloc.is_tracing():
+            return data
+        
+        with self._lock:
+            baseline, previous, latest = self.baseline, self.previous, self.latest
+        traced, peak = tracemalloc.get_traced_memory()
+        data['traced_mb'] = _mb(traced)
+        data['traced_peak_mb'] = _mb(peak)
+        if latest is not None:
+            data['top'] = _format_stats(latest.statistics('lineno'), limit)
+        if previous is not None:
+            data['diff_previous'] = _format_stats(latest.compare_to(previous, 'lineno'), limit)
+        if baseline is not None and baseline is not latest:
+            data['diff_baseline'] = _format_stats(latest.compare_to(baseline, 'lineno'), limit)
+        return data
+
+memory_profiler = MemoryProfiler()
+
+def require_debug_token(f):
+    """Routes de diagnostic : Bearer MEMORY_DEBUG_TOKEN, 404 si aucun jeton configuré"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = Config.MEMORY_DEBUG_TOKEN
+        if not token:
+            abort(404)
+        supplied = request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return jsonify({'error': 'Non autorise'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def init_memory_profiler(app):
+    """Démarre l'échantillonnage dans chaque worker et enregistre /debug/memory"""
+    app.before_request(memory_profiler.ensure_started)
+    
+    @app.route('/debug/memory')
+    @require_debug_token
+    def debug_memory():
+        """RSS, tailles des caches et allocations tracemalloc de ce worker"""
+        if request.args.get('refresh'):
+            memory_profiler.ensure_started()
+            memory_profiler.sample()
+        limit = min(request.args.get('limit', Config.MEMORY_TOP_N, type=int), 100)
+        return jsonify(memory_profiler.report(limit))
@@ -1,9 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.ext.compiler import compiles
 from datetime import datetime
 import secrets
 
-db = SQLAlchemy()
+from backend.db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -26,6 +30,10 @@ class User(UserMixin, db.Model):
 
 class OTPCode(db.Model):
     __tablename__ = 'otp_codes'
+    __table_args__ = (
+        db.Index('ix_otp_codes_lookup', 'user_id', 'purpose', 'used'),
+        db.Index('ix_otp_codes_expires_at', 'expires_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -37,6 +45,9 @@ class OTPCode(db.Model):
 
 class APIUsage(db.Model):
     __tablename__ = 'api_usage'
+    __table_args__ = (
+        db.Index('ix_api_usage_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -44,7 +55,17 @@ class APIUsage(db.Model):
     prompt = db.Column(db.Text)
     response = db.Column(db.Text)
     tokens_used = db.Column(db.Integer)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+@compiles(CreateTable, 'postgresql')
+def _create_partitioned_api_usage(element, compiler, **kw):
+    """Sous PostgreSQL, api_usage est partitionnée par mois sur created_at
+    (la clé de partition doit faire partie de la clé primaire)"""
+    ddl = compiler.visit_create_table(element, **kw)
+    if element.element.name != 'api_usage':
+        return ddl
+    ddl = ddl.replace('PRIMARY KEY (id)', 'PRIMARY KEY (id, created_at)')
+    return ddl.rstrip() + ' PARTITION BY RANGE (created_at)\n\n'
 
 class APIKey(db.Model):
     __tablename__ = 'api_keys'
@@ -55,3 +76,75 @@ class APIKey(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_used = db.Column(db.DateTime, nullable=True)
+
+class AdView(db.Model):
+    __tablename__ = 'ad_views'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'ad_id', 'day', name='uq_ad_views_user_ad_day'),
+        db.Index('ix_ad_views_user_day', 'user_id', 'day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    ad_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UsageDaily(db.Model):
+    __tablename__ = 'usage_daily'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'model', name='uq_usage_daily_user_day_model'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    model = db.Column(db.String(50), nullable=False)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    tokens_used = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    aborted = db.Column(db.Integer, nullable=False, default=0)
+
+class TokenCounter(db.Model):
+    __tablename__ = 'token_counters'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'subject_id', 'period', name='uq_token_counters_scope_subject_period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(8), nullable=False)      # 'user' ou 'key'
+    subject_id = db.Column(db.Integer, nullable=False)   # users.id ou api_keys.id
+    period = db.Column(db.String(10), nullable=False)    # '2026-10-19' ou '2026-10'
+    tokens = db.Column(db.Integer, nullable=False, default=0)
+
+class ChatJob(db.Model):
+    __tablename__ = 'chat_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    api_key_id = db.Column(db.Integer, nullable=True)
+    model = db.Column(db.String(50))
+    prompt = db.Column(db.Text)
+    callback_url = db.Column(db.String(500), nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')   # pending, running, done, error
+    result = db.Column(db.Text, nullable=True)                             # JSON de la réponse
+    error = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)                  # sha256 du modèle + message
+    status = db.Column(db.String(10), nullable=False, default='pending')    # pending, done
+    status_code = db.Column(db.Integer, nullable=True)
+    body = db.Column(db.Text, nullable=True)                                # JSON de la réponse
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
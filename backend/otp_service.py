@@ -0,0 +1,79 @@
+# backend/otp_service.py
+import secrets
+import logging
+from datetime import datetime, timedelta
+
+from backend.models import db, OTPCode
+from backend.config import Config
+from backend.housekeeping import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+class OTPService:
+    @staticmethod
+    def issue(user_id, purpose):
+        """Crée un nouveau code et supprime les précédents non utilisés"""
+        OTPService.maybe_purge()
+        
+        OTPCode.query.filter_by(user_id=user_id, purpose=purpose, used=False)\
+            .delete(synchronize_session=False)
+        
+        code = secrets.token_hex(3).upper()
+        db.session.add(OTPCode(
+            user_id=user_id,
+            code=code,
+            purpose=purpose,
+            expires_at=datetime.utcnow() + timedelta(minutes=Config.OTP_TTL_MINUTES)
+        ))
+        return code
+
+    @staticmethod
+    def find(user_id, code, purpose):
+        """Retourne (otp, erreur) pour le code actif de l'utilisateur"""
+        otp = OTPCode.query.filter_by(
+            user_id=user_id,
+            purpose=purpose,
+            used=False,
+            code=(code or '').upper().strip()
+        ).first()
+        
+        if not otp:
+            return None, 'Code invalide'
+        
+        if otp.expires_at < datetime.utcnow():
+            return None, 'Code expire'
+        
+        return otp, None
+
+    @staticmethod
+    def maybe_purge():
+        """Purge au plus une fois par OTP_PURGE_INTERVAL secondes et par worker"""
+        return _purge_task.maybe_run()
+
+    @staticmethod
+    def purge_expired(batch_size=None):
+        """Supprime par lots les codes expirés ou utilisés"""
+        batch_size = batch_size or Config.OTP_PURGE_BATCH_SIZE
+        total = 0
+        while True:
+            ids = [row.id for row in db.session.query(OTPCode.id).filter(
+                db.or_(OTPCode.expires_at < datetime.utcnow(), OTPCode.used.is_(True))
+            ).limit(batch_size)]
+            if not ids:
+                break
+            OTPCode.query.filter(OTPCode.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            total += len(ids)
+            if len(ids) < batch_size:
+                break
+        if total:
+            logger.info("%s codes OTP purgés", total)
+        return total
+
+    @staticmethod
+    def ensure_indexes():
+        """Crée les index OTP sur une table existante"""
+        for index in OTPCode.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+_purge_task = PeriodicTask('otp', 'OTP_PURGE_INTERVAL', OTPService.purge_expired)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""Partitions mensuelles de api_usage : création, rétention, archivage.
+
+Usage :
+    python -m backend.partitions maintain   # partitions futures + rétention
+    python -m backend.partitions convert    # convertit une table existante (PostgreSQL)
+"""
+import os
+import sys
+import gzip
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import text, event
+
+from backend.models import db, APIUsage
+from backend.config import Config
+from backend.housekeeping import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+TABLE = APIUsage.__tablename__
+COLUMNS = [c.name for c in APIUsage.__table__.columns]
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y%m}"
+
+def partition_statements(start=None, months_ahead=None):
+    """DDL des partitions du mois courant (ou de start) jusqu'à months_ahead
+    mois, puis de la partition DEFAULT"""
+    months_ahead = Config.USAGE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(datetime.utcnow())
+    month = month_start(start) if start else current
+    statements = []
+    while month <= add_months(current, months_ahead):
+        statements.append(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        )
+        month = add_months(month, 1)
+    # Filet de sécurité pour les dates hors plage
+    statements.append(f"CREATE TABLE IF NOT EXISTS {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+    return statements
+
+class PartitionManager:
+    """Sous PostgreSQL, api_usage est partitionnée par mois (PARTITION BY RANGE).
+    Les anciens mois sont archivés puis détachés et supprimés d'un bloc.
+    Sous SQLite (tests), même interface : suppression par plage de dates.
+    """
+
+    @staticmethod
+    def is_postgres():
+        return db.engine.dialect.name == 'postgresql'
+
+    @staticmethod
+    def is_partitioned():
+        if not PartitionManager.is_postgres():
+            return False
+        kind = db.session.execute(
+            text("SELECT relkind FROM pg_class WHERE relname = :name AND relkind IN ('r', 'p')"),
+            {'name': TABLE}
+        ).scalar()
+        return kind == 'p'
+
+    @staticmethod
+    def list_partitions():
+        """Mois (datetime du 1er) des partitions existantes"""
+        rows = db.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name"
+        ), {'name': TABLE}).scalars()
+        months = []
+        for name in rows:
+            suffix = name[len(TABLE) + 2:]
+            if name.startswith(f"{TABLE}_p") and suffix.isdigit():
+                months.append(datetime.strptime(suffix, '%Y%m'))
+        return sorted(months)
+
+    @staticmethod
+    def ensure_partitions(start=None, months_ahead=None):
+        """Crée les partitions du mois courant (ou de start) jusqu'à months_ahead mois"""
+        if not PartitionManager.is_partitioned():
+            return 0
+        statements = partition_statements(start, months_ahead)
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+        # La dernière instruction est la partition DEFAULT
+        return len(statements) - 1
+
+    @staticmethod
+    def maybe_ensure_partitions():
+        """Au plus une fois par USAGE_PARTITION_CHECK_INTERVAL secondes et par worker"""
+        return _partition_task.maybe_run()
+
+    @staticmethod
+    def archive_month(month, source=TABLE):
+        """Écrit les lignes du mois dans USAGE_ARCHIVE_DIR (NDJSON gzip), retourne le chemin"""
+        os.makedirs(Config.USAGE_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(Config.USAGE_ARCHIVE_DIR, f"{TABLE}_{month:%Y%m}.ndjson.gz")
+        query = text(
+            f"SELECT {', '.join(COLUMNS)} FROM {source} "
+            f"WHERE created_at >= :start AND created_at < :end ORDER BY id"
+        )
+        result = db.session.execute(
+            query.execution_options(stream_results=True, yield_per=Config.USAGE_EXPORT_CHUNK_SIZE),
+            {'start': month, 'end': add_months(month, 1)}
+        )
+        count = 0
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            for partition in result.partitions():
+                for row in partition:
+                    f.write(json.dumps(dict(row._mapping), default=str, ensure_ascii=False) + '\n')
+                    count += 1
+        result.close()
+        os.replace(path + '.tmp', path)
+        logger.info("%s lignes archivées dans %s", count, path)
+        return path
+
+    @staticmethod
+    def apply_retention(retention_months=None, archive=None):
+        """Supprime (après archivage éventuel) les mois plus anciens que la rétention"""
+        retention_months = Config.USAGE_RETENTION_MONTHS if retention_months is None else retention_months
+        archive = Config.USAGE_ARCHIVE_ENABLED if archive is None else archive
+        if retention_months <= 0:
+            return []
+        cutoff = add_months(month_start(datetime.utcnow()), -retention_months)
+        
+        if PartitionManager.is_partitioned():
+            dropped = []
+            for month in PartitionManager.list_partitions():
+                if month >= cutoff:
+                    continue
+                name = partition_name(month)
+                if archive:
+                    PartitionManager.archive_month(month, source=name)
+                db.session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+                db.session.execute(text(f"DROP TABLE {name}"))
+                db.session.commit()
+                dropped.append(name)
+                logger.info("Partition %s supprimée", name)
+            return dropped
+        
+        # Repli sans partitions : un DELETE par plage plutôt que ligne par ligne
+        oldest = db.session.query(db.func.min(APIUsage.created_at)).scalar()
+        if not oldest or oldest >= cutoff:
+            return []
+        months = []
+        month = month_start(oldest)
+        while month < cutoff:
+            if archive:
+                PartitionManager.archive_month(month)
+            months.append(f"{month:%Y-%m}")
+            month = add_months(month, 1)
+        APIUsage.query.filter(APIUsage.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        logger.info("Historique d'utilisation supprimé avant %s", f"{cutoff:%Y-%m}")
+        return months
+
+    @staticmethod
+    def convert_existing():
+        """Remplace une table api_usage classique par la version partitionnée.
+
+        L'ancienne table est conservée sous le nom api_usage_legacy.
+        """
+        if not PartitionManager.is_postgres() or PartitionManager.is_partitioned():
+            return False
+        legacy = f"{TABLE}_legacy"
+        db.session.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+        db.session.execute(text(f"ALTER TABLE {legacy} RENAME CONSTRAINT {TABLE}_pkey TO {legacy}_pkey"))
+        db.session.execute(text(f"ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {legacy}_id_seq"))
+        for index in APIUsage.__table__.indexes:
+            db.session.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        db.session.commit()
+        
+        APIUsage.__table__.create(db.engine)
+        oldest = db.session.execute(text(f"SELECT MIN(created_at) FROM {legacy}")).scalar()
+        PartitionManager.ensure_partitions(start=oldest)
+        
+        columns = ', '.join(COLUMNS)
+        db.session.execute(text(
+            f"INSERT INTO {TABLE} ({columns}) SELECT {columns.replace('created_at', 'COALESCE(created_at, now())')} FROM {legacy}"
+        ))
+        db.session.execute(text(
+            f"SELECT setval('{TABLE}_id_seq', (SELECT COALESCE(MAX(id), 0) + 1 FROM {TABLE}), false)"
+        ))
+        db.session.commit()
+        logger.info("Table %s convertie (ancienne table : %s)", TABLE, legacy)
+        return True
+
+@event.listens_for(APIUsage.__table__, 'after_create')
+def _create_initial_partitions(target, connection, **kw):
+    """Une table partitionnée sans partition refuse tout INSERT : les
+    partitions sont créées avec la table (db.create_all, convert), sans
+    attendre la première vérification périodique"""
+    if connection.dialect.name != 'postgresql':
+        return
+    for statement in partition_statements():
+        connection.execute(text(statement))
+
+_partition_task = PeriodicTask('partitions', 'USAGE_PARTITION_CHECK_INTERVAL', PartitionManager.ensure_partitions)
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ('maintain', 'convert'):
+        print(__doc__)
+        sys.exit(1)
+    
+    from backend.app import app
+    with app.app_context():
+        if command == 'convert':
+            print("✅ Table convertie" if PartitionManager.convert_existing() else "Rien à convertir")
+        created = PartitionManager.ensure_partitions()
+        removed = PartitionManager.apply_retention()
+    print(f"✅ {created} partitions vérifiées, {len(removed)} mois supprimés")
@@ -0,0 +1,99 @@
+# backend/password_service.py
+import os
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class PasswordPoolBusy(Exception):
+    """Trop de hachages en attente"""
+
+class PasswordService:
+    """Hachage des mots de passe dans un pool de processus borné.
+
+    Le KDF ne tourne plus dans le thread de la requête : au plus
+    PASSWORD_MAX_PENDING opérations sont en cours par worker, les
+    suivantes attendent PASSWORD_QUEUE_TIMEOUT secondes puis échouent.
+    Les processus sont lancés par forkserver (ou spawn) et non par fork :
+    forker un worker multi-thread peut copier un verrou tenu.
+    """
+    _pool = None
+    _pid = None
+    _slots = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_pool(cls):
+        if cls._pool is None or cls._pid != os.getpid():
+            with cls._lock:
+                if cls._pid != os.getpid():
+                    cls._slots = threading.BoundedSemaphore(Config.PASSWORD_MAX_PENDING)
+                    cls._pid = os.getpid()
+                    cls._pool = None
+                if cls._pool is None:
+                    cls._pool = ProcessPoolExecutor(max_workers=Config.PASSWORD_POOL_WORKERS,
+                                                    mp_context=cls._mp_context())
+        return cls._pool
+
+    @staticmethod
+    def _mp_context():
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('forkserver')
+        return multiprocessing.get_context('spawn')
+
+    @classmethod
+    def _reset_pool(cls, broken):
+        """Remplace un pool cassé (processus tué par l'OOM killer, etc.)"""
+        with cls._lock:
+            if cls._pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                cls._pool = None
+
+    @classmethod
+    def _run(cls, func, *args):
+        if Config.PASSWORD_POOL_WORKERS <= 0:
+            return func(*args)
+        
+        pool = cls._get_pool()
+        slots = cls._slots
+        if not slots.acquire(timeout=Config.PASSWORD_QUEUE_TIMEOUT):
+            logger.warning("Pool de hachage sature")
+            raise PasswordPoolBusy()
+        try:
+            try:
+                return pool.submit(func, *args).result()
+            except BrokenProcessPool:
+                logger.warning("Pool de hachage cassé, recréation")
+                cls._reset_pool(pool)
+            pool = cls._get_pool()
+            try:
+                return pool.submit(func, *args).result()
+            except BrokenProcessPool:
+                # Deuxième échec : on hache dans le thread plutôt que d'échouer
+                logger.error("Pool de hachage indisponible, hachage dans le worker")
+                cls._reset_pool(pool)
+                return func(*args)
+        finally:
+            slots.release()
+
+    @classmethod
+    def hash_password(cls, password):
+        return cls._run(generate_password_hash, password)
+
+    @classmethod
+    def check_password(cls, password_hash, password):
+        return cls._run(check_password_hash, password_hash, password)
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=False, cancel_futures=True)
+            cls._pool = None
+            cls._pid = None
@@ -0,0 +1,151 @@
+# backend/quota_service.py
+import time
+import threading
+import logging
+from datetime import datetime
+
+from backend.models import db, TokenCounter
+from backend.config import Config
+from backend.db_utils import upsert_increment
+
+logger = logging.getLogger(__name__)
+
+class QuotaExceeded(Exception):
+    """Quota de tokens atteint"""
+
+class QuotaService:
+    """Quotas de tokens journaliers et mensuels, par utilisateur et par clé.
+
+    Les vérifications se font sur des compteurs en mémoire : valeur lue en
+    base au premier accès + tokens consommés depuis par ce worker. Toutes
+    les QUOTA_FLUSH_INTERVAL secondes, les deltas sont ajoutés à
+    token_counters et les valeurs relues, ce qui intègre la consommation
+    des autres workers et survit aux redémarrages.
+    """
+    _counters = {}          # (scope, subject_id, period) -> [base, pending]
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()     # un seul flush à la fois
+    _last_flush = time.monotonic()
+
+    @staticmethod
+    def _periods(now=None):
+        now = now or datetime.utcnow()
+        return (('daily', now.strftime('%Y-%m-%d')), ('monthly', now.strftime('%Y-%m')))
+
+    @staticmethod
+    def _limits(scope):
+        if scope == 'user':
+            return {'daily': Config.QUOTA_USER_DAILY_TOKENS, 'monthly': Config.QUOTA_USER_MONTHLY_TOKENS}
+        return {'daily': Config.QUOTA_KEY_DAILY_TOKENS, 'monthly': Config.QUOTA_KEY_MONTHLY_TOKENS}
+
+    @staticmethod
+    def _subjects(user_id, key_id):
+        subjects = [('user', user_id)]
+        if key_id is not None:
+            subjects.append(('key', key_id))
+        return subjects
+
+    @classmethod
+    def _counter(cls, scope, subject_id, period):
+        key = (scope, subject_id, period)
+        counter = cls._counters.get(key)
+        if counter is None:
+            row = TokenCounter.query.filter_by(scope=scope, subject_id=subject_id, period=period).first()
+            with cls._lock:
+                counter = cls._counters.setdefault(key, [row.tokens if row else 0, 0])
+        return counter
+
+    @classmethod
+    def check(cls, user_id, key_id=None):
+        """Lève QuotaExceeded si un des quotas applicables est atteint"""
+        for scope, subject_id in cls._subjects(user_id, key_id):
+            limits = cls._limits(scope)
+            for name, period in cls._periods():
+                limit = limits[name]
+                if limit <= 0:
+                    continue
+                base, pending = cls._counter(scope, subject_id, period)
+                if base + pending >= limit:
+                    raise QuotaExceeded(
+                        f"Quota {'journalier' if name == 'daily' else 'mensuel'} de {limit} tokens atteint"
+                    )
+
+    @classmethod
+    def add(cls, user_id, key_id, tokens):
+        if not tokens:
+            return
+        for scope, subject_id in cls._subjects(user_id, key_id):
+            for _, period in cls._periods():
+                key = (scope, subject_id, period)
+                while True:
+                    counter = cls._counter(*key)
+                    with cls._lock:
+                        # Le compteur a pu être retiré par un flush concurrent
+                        if cls._counters.get(key) is counter:
+                            counter[1] += tokens
+                            break
+        if time.monotonic() - cls._last_flush >= Config.QUOTA_FLUSH_INTERVAL:
+            cls.flush(wait=False)
+
+    @classmethod
+    def usage(cls, user_id, key_id=None):
+        """Consommation et limites courantes (pour l'API)"""
+        result = {}
+        for scope, subject_id in cls._subjects(user_id, key_id):
+            limits = cls._limits(scope)
+            for name, period in cls._periods():
+                base, pending = cls._counter(scope, subject_id, period)
+                result[f"{scope}_{name}"] = {'used': base + pending, 'limit': limits[name] or None}
+        return result
+
+    @classmethod
+    def flush(cls, wait=True):
+        """Reporte les deltas en base puis relit les totaux.
+
+        Les flush sont sérialisés : un compteur n'est oublié qu'après le
+        commit du flush qui l'a reporté. Sans wait, on n'attend pas un
+        flush déjà en cours : les nouveaux deltas partiront au suivant.
+        """
+        if not cls._flush_lock.acquire(blocking=wait):
+            return False
+        try:
+            return cls._flush_locked()
+        finally:
+            cls._flush_lock.release()
+
+    @classmethod
+    def _flush_locked(cls):
+        with cls._lock:
+            cls._last_flush = time.monotonic()
+            pending = {key: counter[1] for key, counter in cls._counters.items() if counter[1]}
+            for key, tokens in pending.items():
+                # base + pending reste constant pendant l'écriture
+                cls._counters[key][0] += tokens
+                cls._counters[key][1] -= tokens
+        
+        if pending:
+            try:
+                for (scope, subject_id, period), tokens in pending.items():
+                    upsert_increment(
+                        TokenCounter,
+                        {'scope': scope, 'subject_id': subject_id, 'period': period},
+                        {'tokens': tokens}
+                    )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Erreur sauvegarde quotas: %s", e)
+                with cls._lock:
+                    for key, tokens in pending.items():
+                        counter = cls._counters.setdefault(key, [tokens, 0])
+                        counter[0] -= tokens
+                        counter[1] += tokens
+                return False
+        
+        # On oublie les périodes passées et on relit le reste au prochain accès
+        current = {period for _, period in cls._periods()}
+        with cls._lock:
+            for key in list(cls._counters):
+                if key[2] not in current or not cls._counters[key][1]:
+                    del cls._counters[key]
+        return True
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+"""Capture et rejeu de trafic chat à partir de api_usage.
+
+Usage :
+  python -m backend.replay capture trace.jsonl [--since 2024-01-01] [--until 2024-02-01] [--limit 10000] [--buckets 100]
+  python -m backend.replay run trace.jsonl [--speed 1] [--config "CHAT_SCHEDULER_SLOTS=4 upstreams=2"] ...
+
+La capture ne garde rien d'identifiant : empreinte salée du prompt, longueurs,
+décalage temporel et un numéro de groupe d'utilisateurs (avec son poids
+d'ordonnancement). Le rejeu lance l'application sur une base SQLite
+temporaire, devant de faux services Okitakoy locaux, une fois par
+configuration, et compare débit, latences et taux de succès du cache.
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import hashlib
+import secrets
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.bench_login import percentile
+
+# ============================================
+# CAPTURE
+# ============================================
+
+def capture(args):
+    from backend.app import app
+    from backend.models import db, APIUsage, User
+    from backend.usage_service import UsageService
+    from backend.fair_scheduler import FairScheduler
+
+    salt = (args.salt or secrets.token_hex(16)).encode()
+    digest = lambda value: hmac.new(salt, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+    query = db.select(
+        APIUsage.user_id, APIUsage.model, APIUsage.prompt, APIUsage.tokens_used,
+        APIUsage.created_at, User.is_verified, User.max_api_keys
+    ).join(User, User.id == APIUsage.user_id)
+    start = UsageService.parse_day(args.since)
+    end = UsageService.parse_day(args.until, end=True)
+    if start:
+        query = query.where(APIUsage.created_at >= start)
+    if end:
+        query = query.where(APIUsage.created_at < end)
+    query = query.order_by(APIUsage.created_at)
+    if args.limit:
+        query = query.limit(args.limit)
+
+    count = 0
+    first = None
+    with app.app_context(), open(args.trace, 'w') as out:
+        for rows in UsageService.iter_rows(query):
+            for row in rows:
+                first = first or row.created_at
+                prompt = row.prompt or ''
+                prompt_words = len(prompt.split())
+                bucket = int(digest(str(row.user_id)), 16) % args.buckets
+                tier = SimpleNamespace(is_verified=row.is_verified, max_api_keys=row.max_api_keys)
+                out.write(json.dumps({
+                    't': round((row.created_at - first).total_seconds(), 3),
+                    'user': bucket,
+                    'weight': FairScheduler.weight_for(tier),
+                    'model': row.model or 'okitakoy',
+                    'prompt_hash': digest(prompt),
+                    'prompt_chars': len(prompt),
+                    'prompt_words': prompt_words,
+                    'response_words': max(1, (row.tokens_used or 0) - prompt_words)
+                }) + '\n')
+                count += 1
+    print(f"{count} requêtes capturées dans {args.trace}")
+
+# ============================================
+# FAUX UPSTREAM
+# ============================================
+
+class FakeUpstream:
+    """Service Okitakoy local : latence = base + par mot de réponse"""
+
+    def __init__(self, responses, base_delay, word_delay):
+        self.responses = responses
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                text = parse_qs(urlparse(handler.path).query).get('text', [''])[0]
+                marker = (text.split('[USER]\n', 1)[-1].split() or [''])[0]
+                words = responses.get(marker, 20)
+                time.sleep(base_delay + word_delay * words)
+                body = json.dumps({'response': ' '.join(['mot'] * words)}).encode()
+                try:
+                    handler.send_response(200)
+                    handler.send_header('Content-Type', 'application/json')
+                    handler.send_header('Content-Length', str(len(body)))
+                    handler.end_headers()
+                    handler.wfile.write(body)
+                except OSError:
+                    pass  # requête annulée côté application
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ============================================
+# REJEU
+# ============================================
+
+def synthetic_prompt(event):
+    """Prompt déterministe : même empreinte -> même texte, même longueur"""
+    words = [event['prompt_hash']] + ['x'] * max(0, event['prompt_words'] - 1)
+    return ' '.join(words)
+
+def parse_config(text):
+    """'CHAT_SCHEDULER_SLOTS=4 upstreams=2' -> dict ; les clés en minuscules sont propres au rejeu"""
+    from backend.config import Config
+    overrides = {}
+    for item in text.split():
+        name, _, raw = item.partition('=')
+        if name.islower():
+            overrides[name] = float(raw) if '.' in raw else int(raw)
+            continue
+        if not hasattr(Config, name):
+            raise SystemExit(f"Paramètre inconnu : {name}")
+        current = getattr(Config, name)
+        if isinstance(current, bool):
+            overrides[name] = raw.lower() == 'true'
+        elif isinstance(current, (int, float)):
+            overrides[name] = type(current)(raw)
+        else:
+            overrides[name] = raw
+    return overrides
+
+def simulate_cache(events, size):
+    """Taux de succès d'un cache LRU de réponses sur (modèle, prompt)"""
+    if size <= 0:
+        return 0.0
+    cache = OrderedDict()
+    hits = 0
+    for event in events:
+        key = (event['model'], event['prompt_hash'])
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+            continue
+        cache[key] = True
+        if len(cache) > size:
+            cache.popitem(last=False)
+    return hits / len(events) if events else 0.0
+
+def replay(app, events, keys, label, overrides, args):
+    from backend.config import Config
+    from backend.app import chat_service
+    from backend.upstream_pool import UpstreamPool
+    from backend.fair_scheduler import chat_scheduler
+
+    saved = {name: getattr(Config, name) for name in overrides if not name.islower()}
+    for name, value in saved.items():
+        setattr(Config, name, overrides[name])
+
+    responses = {event['prompt_hash']: event['response_words'] for event in events}
+    upstreams = [FakeUpstream(responses,
+                              overrides.get('base_delay', args.base_delay),
+                              overrides.get('word_delay', args.word_delay))
+                 for _ in range(int(overrides.get('upstreams', 1)))]
+    chat_service.pool = UpstreamPool([u.url for u in upstreams])
+    for model in chat_service.models.values():
+        model.pop('upstreams', None)
+    # Réinitialisé sur place : chat_service garde une référence au singleton
+    chat_scheduler.__init__(Config.CHAT_SCHEDULER_SLOTS, Config.CHAT_USER_QUEUE_SIZE, Config.CHAT_QUEUE_TIMEOUT)
+
+    latencies = []
+    lateness = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def send(event, due):
+        start = time.perf_counter()
+        try:
+            res = app.test_client().post('/api/chat',
+                              json={'model': event['model'], 'message': synthetic_prompt(event)},
+                              headers={'Authorization': f"Bearer {keys[event['user']]}"})
+            status = res.status_code
+        except Exception as e:
+            status = type(e).__name__
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            lateness.append(max(0.0, start - due))
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for event in events:
+            due = start + event['t'] / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, event, due)
+    elapsed = time.perf_counter() - start
+
+    for upstream in upstreams:
+        upstream.close()
+    for name, value in saved.items():
+        setattr(Config, name, value)
+
+    scheduler = chat_scheduler.stats()
+    ok = statuses.get(200, 0)
+    cache_size = int(overrides.get('cache_size', args.cache_size))
+    print(f"\n== {label or 'configuration par défaut'}")
+    print(f"   requêtes {len(events)} | succès {ok} | codes {dict(statuses)}")
+    print(f"   débit {ok / elapsed:7.1f} req/s sur {elapsed:.1f}s")
+    print(f"   latence p50 {percentile(latencies, 50) * 1000:7.1f}ms "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f}ms "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f}ms "
+          f"| retard d'envoi p95 {percentile(lateness, 95) * 1000:6.1f}ms")
+    print(f"   cache réponses LRU({cache_size}) : succès {simulate_cache(events, cache_size) * 100:5.1f}%")
+    print(f"   ordonnanceur : rejets {scheduler['rejected']} | délais dépassés {scheduler['timeouts']} "
+          f"| attente par poids {json.dumps(scheduler['wait_by_weight'])}")
+    for stats in chat_service.upstream_stats()['default']:
+        print(f"   upstream {stats['url']} : {stats['requests']} requêtes, "
+              f"{stats['errors']} erreurs, latence moyenne {stats['ewma_latency_ms']}ms")
+
+def run(args):
+    with open(args.trace) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if args.limit:
+        events = events[:args.limit]
+    if not events:
+        raise SystemExit("Trace vide")
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'replay.db')
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from backend.app import app
+    from backend.config import Config
+    from backend.models import db, User, APIKey
+
+    # Un utilisateur par groupe, avec le palier qui redonne le poids capturé
+    weights = {}
+    for event in events:
+        weights.setdefault(event['user'], event.get('weight', 1))
+    keys = {}
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        for bucket, weight in weights.items():
+            user = User(email=f'replay{bucket}@example.com', username=f'replay{bucket}',
+                        is_verified=weight > 1, max_api_keys=5 + max(0, weight - 2) * Config.CHAT_WEIGHT_KEYS_STEP)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(APIKey(user_id=user.id, key=user.api_key))
+            keys[bucket] = user.api_key
+        db.session.commit()
+
+    duration = events[-1]['t'] / args.speed
+    print(f"{len(events)} requêtes, {len(weights)} groupes d'utilisateurs, "
+          f"durée rejouée {duration:.1f}s (vitesse x{args.speed})")
+    for text in args.config or ['']:
+        replay(app, events, keys, text, parse_config(text), args)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    cap = sub.add_parser('capture', help="extrait une trace anonymisée de api_usage")
+    cap.add_argument('trace')
+    cap.add_argument('--since', help="YYYY-MM-DD")
+    cap.add_argument('--until', help="YYYY-MM-DD (inclus)")
+    cap.add_argument('--limit', type=int)
+    cap.add_argument('--buckets', type=int, default=100, help="nombre de groupes d'utilisateurs")
+    cap.add_argument('--salt', help="sel des empreintes (aléatoire par défaut)")
+
+    rep = sub.add_parser('run', help="rejoue une trace contre l'application")
+    rep.add_argument('trace')
+    rep.add_argument('--speed', type=float, default=1.0, help="facteur d'accélération")
+    rep.add_argument('--limit', type=int)
+    rep.add_argument('--concurrency', type=int, default=64, help="clients simultanés maximum")
+    rep.add_argument('--config', action='append',
+                     help="réglages d'une passe, ex. \"CHAT_SCHEDULER_SLOTS=4 upstreams=2 cache_size=500\" (répétable)")
+    rep.add_argument('--base-delay', type=float, default=0.2, help="latence fixe du faux upstream (s)")
+    rep.add_argument('--word-delay', type=float, default=0.002, help="latence par mot de réponse (s)")
+    rep.add_argument('--cache-size', type=int, default=1000, help="taille du cache LRU simulé")
+
+    args = parser.parse_args()
+    if args.command == 'capture':
+        capture(args)
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# backend/upstream_pool.py
+import time
+import threading
+import logging
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class Upstream:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.aborted = 0
+        self.ejections = 0
+
+    def is_available(self, now):
+        return self.ejected_until <= now
+
+    def score(self):
+        # Moins de requêtes en cours d'abord, puis les échecs récents et la latence moyenne
+        return (self.outstanding, self.consecutive_failures, self.ewma_latency or 0.0)
+
+    def to_dict(self, now):
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'ewma_latency_ms': round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'aborted': self.aborted,
+            'ejections': self.ejections,
+            'healthy': self.is_available(now)
+        }
+
+class UpstreamPool:
+    """Répartition least-outstanding-requests entre plusieurs workers Okitakoy.
+
+    Un upstream qui échoue UPSTREAM_MAX_FAILURES fois de suite est écarté
+    pendant UPSTREAM_EJECT_SECONDS ; il est ensuite réadmis et une nouvelle
+    erreur l'écarte à nouveau immédiatement.
+    """
+
+    def __init__(self, urls):
+        if not urls:
+            raise ValueError("Au moins un upstream est requis")
+        self.upstreams = [Upstream(url) for url in urls]
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [u for u in self.upstreams if u.is_available(now)]
+            if not candidates:
+                # Tous écartés : on tente celui qui revient le plus tôt
+                candidates = [min(self.upstreams, key=lambda u: u.ejected_until)]
+            upstream = min(candidates, key=Upstream.score)
+            upstream.outstanding += 1
+            upstream.requests += 1
+            return upstream
+
+    def release(self, upstream, latency, ok, aborted=False):
+        with self._lock:
+            upstream.outstanding -= 1
+            if aborted:
+                # Annulé par le client : ni latence ni échec imputables à l'upstream
+                upstream.aborted += 1
+                return
+            alpha = Config.UPSTREAM_EWMA_ALPHA
+            if upstream.ewma_latency is None:
+                upstream.ewma_latency = latency
+            else:
+                upstream.ewma_latency = alpha * latency + (1 - alpha) * upstream.ewma_latency
+            
+            if ok:
+                upstream.consecutive_failures = 0
+                return
+            
+            upstream.errors += 1
+            upstream.consecutive_failures += 1
+            if upstream.consecutive_failures >= Config.UPSTREAM_MAX_FAILURES:
+                upstream.ejected_until = time.monotonic() + Config.UPSTREAM_EJECT_SECONDS
+                upstream.consecutive_failures = Config.UPSTREAM_MAX_FAILURES - 1
+                upstream.ejections += 1
+                logger.warning("Upstream écarté pour %ss: %s", Config.UPSTREAM_EJECT_SECONDS, upstream.url)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [u.to_dict(now) for u in self.upstreams]
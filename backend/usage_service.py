@@ -0,0 +1,202 @@
+# backend/usage_service.py
+import csv
+import io
+import sys
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from backend.models import db, APIUsage, UsageDaily
+from backend.config import Config
+from backend.db_utils import upsert_increment, upsert_from_select
+from backend.quota_service import QuotaService
+from backend.partitions import PartitionManager
+from backend.dashboard_service import DashboardService
+from backend.cancellation import ABORTED
+from backend.fair_scheduler import QUEUE_FULL, QUEUE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ('id', 'model', 'prompt', 'response', 'tokens_used', 'created_at')
+
+class UsageService:
+    @staticmethod
+    def record(user_id, model, prompt, response, tokens_used):
+        """Ajoute la ligne d'usage et met à jour le cumul du jour (sans commit)"""
+        usage = APIUsage(
+            user_id=user_id,
+            model=model,
+            prompt=prompt,
+            response=response,
+            tokens_used=tokens_used
+        )
+        db.session.add(usage)
+        UsageService.increment_rollup(user_id, model, requests=1, tokens_used=tokens_used or 0)
+        return usage
+
+    @staticmethod
+    def log_chat(user_id, key_id, model, message, response, error):
+        """Enregistre le résultat d'un appel chat (usage, cumuls, quotas)"""
+        if error in ("Modele non supporte", QUEUE_FULL, QUEUE_TIMEOUT):
+            # Refusé avant tout appel upstream
+            return
+        if error == ABORTED:
+            # Client parti : pas de ligne api_usage ni de quota, seulement le compteur
+            try:
+                UsageService.increment_rollup(user_id, model, aborted=1)
+                db.session.commit()
+            except Exception as e:
+                logger.error("Erreur sauvegarde usage: %s", e)
+                db.session.rollback()
+            return
+        PartitionManager.maybe_ensure_partitions()
+        try:
+            if error:
+                UsageService.record_error(user_id, model)
+            else:
+                UsageService.record(user_id, model, message, response['response'], response['tokens_used'])
+            db.session.commit()
+        except Exception as e:
+            logger.error("Erreur sauvegarde usage: %s", e)
+            db.session.rollback()
+        
+        DashboardService.invalidate(user_id)
+        if not error:
+            QuotaService.add(user_id, key_id, response['tokens_used'])
+
+    @staticmethod
+    def record_error(user_id, model):
+        UsageService.increment_rollup(user_id, model, errors=1)
+
+    @staticmethod
+    def increment_rollup(user_id, model, requests=0, tokens_used=0, errors=0, aborted=0, day=None):
+        """Upsert atomique sur (user_id, day, model)"""
+        upsert_increment(
+            UsageDaily,
+            {'user_id': user_id, 'day': day or datetime.utcnow().date(), 'model': model},
+            {'requests': requests, 'tokens_used': tokens_used, 'errors': errors, 'aborted': aborted}
+        )
+
+    @staticmethod
+    def stats(user_id, start=None, end=None, model=None):
+        """Totaux, détail par jour et par modèle lus dans usage_daily"""
+        query = UsageDaily.query.filter(UsageDaily.user_id == user_id)
+        if start:
+            query = query.filter(UsageDaily.day >= start.date())
+        if end:
+            query = query.filter(UsageDaily.day < end.date())
+        if model:
+            query = query.filter(UsageDaily.model == model)
+        rows = query.order_by(UsageDaily.day).all()
+        
+        empty = lambda: {'requests': 0, 'tokens_used': 0, 'errors': 0, 'aborted': 0}
+        totals = empty()
+        by_day = {}
+        by_model = {}
+        for row in rows:
+            for bucket in (totals,
+                           by_day.setdefault(str(row.day), empty()),
+                           by_model.setdefault(row.model, empty())):
+                bucket['requests'] += row.requests
+                bucket['tokens_used'] += row.tokens_used
+                bucket['errors'] += row.errors
+                bucket['aborted'] += row.aborted
+        
+        return {
+            'totals': totals,
+            'by_day': [{'day': day, **values} for day, values in by_day.items()],
+            'by_model': by_model
+        }
+
+    @staticmethod
+    def backfill(user_id=None):
+        """Recalcule requests et tokens_used de usage_daily à partir de api_usage.
+
+        Upsert sans suppression : errors et aborted n'existent que dans
+        usage_daily et sont conservés.
+        """
+        day = func.date(APIUsage.created_at)
+        model = func.coalesce(APIUsage.model, 'okitakoy')
+        select = db.select(
+            APIUsage.user_id,
+            day,
+            model,
+            func.count(APIUsage.id),
+            func.coalesce(func.sum(APIUsage.tokens_used), 0)
+        ).group_by(APIUsage.user_id, day, model)
+        if user_id is not None:
+            select = select.where(APIUsage.user_id == user_id)
+        
+        count = upsert_from_select(
+            UsageDaily, ('user_id', 'day', 'model'), ('requests', 'tokens_used'), select
+        )
+        db.session.commit()
+        logger.info("%s cumuls journaliers recalculés", count)
+        return count
+
+    @staticmethod
+    def parse_day(value, end=False):
+        """'YYYY-MM-DD' -> datetime (début du jour, ou lendemain si end)"""
+        if not value:
+            return None
+        day = datetime.strptime(value, '%Y-%m-%d')
+        return day + timedelta(days=1) if end else day
+
+    @staticmethod
+    def export_query(user_id, start=None, end=None, model=None):
+        """Colonnes brutes (pas d'entités ORM) pour ne rien garder en mémoire"""
+        query = db.select(*[getattr(APIUsage, c) for c in EXPORT_COLUMNS])\
+            .where(APIUsage.user_id == user_id)
+        if start:
+            query = query.where(APIUsage.created_at >= start)
+        if end:
+            query = query.where(APIUsage.created_at < end)
+        if model:
+            query = query.where(APIUsage.model == model)
+        return query.order_by(APIUsage.id)
+
+    @staticmethod
+    def iter_rows(query):
+        """Parcourt le résultat via un curseur serveur, par paquets"""
+        result = db.session.execute(
+            query.execution_options(stream_results=True, yield_per=Config.USAGE_EXPORT_CHUNK_SIZE)
+        )
+        try:
+            for partition in result.partitions():
+                yield partition
+        finally:
+            result.close()
+
+    @staticmethod
+    def export_ndjson(query):
+        for rows in UsageService.iter_rows(query):
+            yield ''.join(
+                json.dumps({**row._asdict(), 'created_at': str(row.created_at)}, ensure_ascii=False) + '\n'
+                for row in rows
+            )
+
+    @staticmethod
+    def export_csv(query):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in UsageService.iter_rows(query):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+if __name__ == '__main__':
+    # python -m backend.usage_service backfill [user_id]
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        print("Usage : python -m backend.usage_service backfill [user_id]")
+        sys.exit(1)
+    
+    from backend.app import app
+    with app.app_context():
+        db.create_all()
+        count = UsageService.backfill(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print(f"✅ {count} cumuls journaliers recalculés")
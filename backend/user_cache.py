@@ -0,0 +1,67 @@
+import threading
+import time
+import logging
+from sqlalchemy.orm import make_transient_to_detached
+
+from backend.models import db, User
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class UserCache:
+    """Cache d'identité par worker pour le user_loader de Flask-Login.
+
+    Garde une copie détachée de chaque utilisateur pendant quelques secondes ;
+    à chaque requête elle est rattachée à la session avec merge(load=False),
+    ce qui évite le SELECT sur users tout en gardant un objet modifiable.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = Config.USER_CACHE_TTL if ttl is None else ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self, user):
+        """Copie détachée des colonnes de l'utilisateur"""
+        snapshot = User(**{c.key: getattr(user, c.key) for c in User.__table__.columns})
+        make_transient_to_detached(snapshot)
+        return snapshot
+
+    def get(self, user_id):
+        """Retourne l'utilisateur attaché à la session courante"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry and entry[1] > now:
+            return db.session.merge(entry[0], load=False)
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[user_id] = (self._snapshot(user), now + self.ttl)
+                if len(self._entries) > Config.USER_CACHE_MAX_SIZE:
+                    self._purge(now)
+        return user
+
+    def invalidate(self, user_id):
+        """À appeler après toute modification du compte"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _purge(self, now):
+        expired = [k for k, (_, exp) in self._entries.items() if exp <= now]
+        for k in expired:
+            del self._entries[k]
+        if len(self._entries) > Config.USER_CACHE_MAX_SIZE:
+            oldest = sorted(self._entries, key=lambda k: self._entries[k][1])
+            for k in oldest[:len(self._entries) - Config.USER_CACHE_MAX_SIZE]:
+                del self._entries[k]
+
+user_cache = UserCache()
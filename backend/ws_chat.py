@@ -0,0 +1,220 @@
+# backend/ws_chat.py
+import json
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, g
+from flask_login import current_user
+from flask_sock import Sock, ConnectionClosed
+
+from backend.models import db
+from backend.config import Config
+from backend.keys_service import KeysService
+from backend.quota_service import QuotaService, QuotaExceeded
+from backend.usage_service import UsageService
+from backend.cancellation import ABORTED, CancelToken
+from backend.fair_scheduler import chat_scheduler
+
+logger = logging.getLogger(__name__)
+
+sock = Sock()
+
+def same_origin():
+    """Le navigateur n'applique pas CORS à la poignée de main WebSocket :
+    l'authentification par cookie n'est acceptée que depuis nos pages"""
+    origin = (request.headers.get('Origin') or '').rstrip('/').lower()
+    if not origin:
+        return False
+    allowed = {o.strip().rstrip('/').lower() for o in Config.WS_ALLOWED_ORIGINS.split(',') if o.strip()}
+    allowed.add(request.host_url.rstrip('/').lower())
+    if request.host_url.startswith('http://'):
+        # Derrière un proxy TLS, host_url peut rester en http
+        allowed.add('https://' + request.host.lower())
+    return origin in allowed
+
+class ChatConnection:
+    """Une connexion WebSocket authentifiée une seule fois.
+
+    Messages client : {"id": "1", "model": "gpt4", "message": "..."}
+    Réponses : {"id", "type": "delta", "content"} puis {"id", "type": "done", ...}
+    ou {"id", "type": "error", "error"}. Au plus WS_MAX_INFLIGHT messages
+    sont traités en parallèle. Au-delà, le message est refusé avec une
+    erreur (délestage) au lieu de suspendre la lecture du socket : une
+    lecture suspendue bloquerait aussi les abort et la fermeture. Un id
+    déjà en cours est refusé de la même façon.
+    {"type": "abort", "id": "1"} annule un message en cours, et la fermeture
+    de la connexion annule tous ceux qui restent.
+    """
+
+    def __init__(self, ws, app, chat_service, executor):
+        self.ws = ws
+        self.app = app
+        self.chat_service = chat_service
+        self.executor = executor
+        self.user_id = None
+        self.key_id = None
+        self.weight = 1
+        self._send_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(Config.WS_MAX_INFLIGHT)
+        self._inflight = {}
+        self.closed = False
+
+    def send(self, payload):
+        if self.closed:
+            return False
+        try:
+            with self._send_lock:
+                self.ws.send(json.dumps(payload))
+            return True
+        except ConnectionClosed:
+            self.closed = True
+            return False
+
+    def authenticate(self, token=None):
+        user = self._authenticate(token)
+        if user:
+            self.weight = chat_scheduler.weight_for(user)
+        return user
+
+    def _authenticate(self, token=None):
+        if token:
+            user = KeysService.verify_key(f"Bearer {token}")
+            if user:
+                self.user_id, self.key_id = user.id, g.get('api_key_id')
+                return user
+            return None
+        if current_user and current_user.is_authenticated and same_origin():
+            self.user_id = current_user.id
+            return current_user
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            user = KeysService.verify_key(auth_header)
+            if user:
+                self.user_id, self.key_id = user.id, g.get('api_key_id')
+                return user
+        return None
+
+    def run(self):
+        user = self.authenticate()
+        if user:
+            self.send({'type': 'ready', 'username': user.username})
+        # La connexion dure : on rend tout de suite la connexion SQL au pool
+        db.session.remove()
+        
+        while not self.closed:
+            # On lit toujours le socket : abort et fermeture doivent passer
+            # même quand tous les créneaux sont occupés
+            try:
+                raw = self.ws.receive(timeout=Config.WS_IDLE_TIMEOUT)
+            except ConnectionClosed:
+                break
+            if raw is None:
+                self.ws.close(reason=1000, message='Inactivite')
+                break
+            
+            try:
+                data = json.loads(raw)
+            except (TypeError, ValueError):
+                self.send({'type': 'error', 'error': 'JSON invalide'})
+                continue
+            
+            if data.get('type') == 'abort':
+                token = self._inflight.get(data.get('id'))
+                if token:
+                    token.cancel()
+                continue
+            
+            if data.get('type') == 'auth':
+                if self.user_id is None:
+                    user = self.authenticate(data.get('token'))
+                    if not user:
+                        self.send({'type': 'error', 'error': 'Authentification requise'})
+                        self.ws.close(reason=1008, message='Authentification requise')
+                        break
+                    self.send({'type': 'ready', 'username': user.username})
+                    db.session.remove()
+                continue
+            
+            if self.user_id is None:
+                self.send({'type': 'error', 'id': data.get('id'), 'error': 'Authentification requise'})
+                continue
+            
+            if data.get('id') in self._inflight:
+                # Réutiliser l'id écraserait le jeton d'annulation du message en cours
+                self.send({'type': 'error', 'id': data.get('id'), 'error': 'Identifiant deja en cours'})
+                continue
+            
+            # La limite ne s'applique qu'aux nouveaux messages chat
+            if not self._slots.acquire(blocking=False):
+                self.send({'type': 'error', 'id': data.get('id'), 'error': 'Trop de messages en cours'})
+                continue
+            
+            token = CancelToken()
+            self._inflight[data.get('id')] = token
+            self.executor.submit(self._handle, data, token)
+        
+        self.closed = True
+        for token in list(self._inflight.values()):
+            token.cancel()
+
+    def _handle(self, data, cancel):
+        msg_id = data.get('id')
+        model = data.get('model', 'okitakoy')
+        message = data.get('message')
+        try:
+            with self.app.app_context():
+                if not message:
+                    self.send({'id': msg_id, 'type': 'error', 'error': 'Message requis'})
+                    return
+                try:
+                    QuotaService.check(self.user_id, self.key_id)
+                except QuotaExceeded as e:
+                    self.send({'id': msg_id, 'type': 'error', 'error': str(e)})
+                    return
+                
+                response, error = self.chat_service.process_message(
+                    model, message, cancel, self.user_id, self.weight
+                )
+                UsageService.log_chat(self.user_id, self.key_id, model, message, response, error)
+                
+                if error == ABORTED:
+                    self.send({'id': msg_id, 'type': 'aborted'})
+                    return
+                if error:
+                    self.send({'id': msg_id, 'type': 'error', 'error': error})
+                    return
+                
+                # Le service Okitakoy répond en une fois : on découpe pour l'affichage progressif
+                words = response['response'].split(' ')
+                for i in range(0, len(words), Config.WS_STREAM_CHUNK_WORDS):
+                    chunk = ' '.join(words[i:i + Config.WS_STREAM_CHUNK_WORDS])
+                    if i + Config.WS_STREAM_CHUNK_WORDS < len(words):
+                        chunk += ' '
+                    if cancel.cancelled:
+                        self.send({'id': msg_id, 'type': 'aborted'})
+                        return
+                    if not self.send({'id': msg_id, 'type': 'delta', 'content': chunk}):
+                        return
+                self.send({
+                    'id': msg_id,
+                    'type': 'done',
+                    'model': response['model'],
+                    'provider': response['provider'],
+                    'tokens_used': response['tokens_used']
+                })
+        except Exception as e:
+            logger.error("Erreur WebSocket chat: %s", e)
+            self.send({'id': msg_id, 'type': 'error', 'error': 'Erreur serveur'})
+        finally:
+            if self._inflight.get(msg_id) is cancel:
+                del self._inflight[msg_id]
+            self._slots.release()
+
+def init_ws_chat(app, chat_service):
+    """Enregistre /ws/chat"""
+    sock.init_app(app)
+    executor = ThreadPoolExecutor(max_workers=Config.WS_WORKERS, thread_name_prefix='ws-chat')
+    
+    @sock.route('/ws/chat')
+    def chat_ws(ws):
+        ChatConnection(ws, app, chat_service, executor).run()
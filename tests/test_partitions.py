@@ -0,0 +1,52 @@
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_mock_engine, create_engine, text
+
+from backend.models import APIUsage
+from backend.partitions import TABLE, month_start, partition_name, partition_statements
+
+
+def test_create_table_also_creates_partitions():
+    """Le DDL émis pour api_usage sous PostgreSQL contient les partitions"""
+    statements = []
+    
+    def executor(sql, *multiparams, **params):
+        statements.append(str(sql.compile(dialect=engine.dialect)))
+    
+    engine = create_mock_engine('postgresql://', executor)
+    APIUsage.__table__.create(engine, checkfirst=False)
+    
+    assert 'PARTITION BY RANGE (created_at)' in statements[0]
+    ddl = '\n'.join(statements)
+    assert f"{partition_name(month_start(datetime.utcnow()))} PARTITION OF {TABLE}" in ddl
+    assert f"{TABLE}_default PARTITION OF {TABLE} DEFAULT" in ddl
+
+
+def test_partition_statements_end_with_default():
+    statements = partition_statements(months_ahead=2)
+    assert len(statements) == 4
+    assert statements[-1].endswith('DEFAULT')
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_POSTGRES_URL'), reason="TEST_POSTGRES_URL non défini")
+def test_first_insert_into_fresh_partitioned_table():
+    """Premier INSERT juste après la création, sans passage par ensure_partitions"""
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    APIUsage.metadata.drop_all(engine)
+    APIUsage.metadata.create_all(engine)
+    try:
+        with engine.begin() as conn:
+            user_id = conn.execute(text(
+                "INSERT INTO users (email, username, api_key) VALUES ('p@t.io', 'p', 'k') RETURNING id"
+            )).scalar()
+            conn.execute(APIUsage.__table__.insert().values(
+                user_id=user_id, model='gpt4', tokens_used=1, created_at=datetime.utcnow()
+            ))
+            conn.execute(APIUsage.__table__.insert().values(
+                user_id=user_id, model='gpt4', tokens_used=1, created_at=datetime(2000, 1, 1)
+            ))
+            assert conn.execute(text(f"SELECT count(*) FROM {TABLE}")).scalar() == 2
+    finally:
+        APIUsage.metadata.drop_all(engine)